@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+from collections import OrderedDict
+
+import numpy as np
+
+from rl.agents.dqn import DQNAgent
+
+
+class QValueCache(object):
+    """状態(観測の並びのバイト列) -> Q値 のLRU. 重みが変わったらclearする"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+
+    def get(self, key):
+        q_values = self.entries.get(key)
+        if q_values is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return q_values
+
+    def put(self, key, q_values):
+        self.entries[key] = q_values
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.clears += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+
+class MyDQNAgent(DQNAgent):
+    """DQNAgentの学習部分を配列のまま扱うようにしたもの
+
+    memoryがsample_batch(RingMemory)を持っていればExperienceを経由せずに
+    minibatchを作り、sample_prioritized(PrioritizedMemory)を持っていれば
+    重要度重みを掛けて学習し、TD誤差で優先度を更新する.
+    それ以外のmemoryでは元のDQNAgentと同じように動く.
+
+    q_cache_size > 0 なら行動選択のQ値をQValueCacheに入れておき、同じ状態では
+    modelを呼ばない. キャッシュは q_cache_staleness 回学習する毎と
+    load_weightsの時に捨てる.
+
+    numpy_inference なら行動選択(fitとtestの両方)のQ値をkerasではなく
+    inference.DenseNetで計算する. 重みは変わった後の最初の行動選択で写す.
+
+    resume_step を入れておくと、次のfitはstep 0ではなくそこから数える
+    (checkpoint.restoreが入れる).
+    """
+    resume_step = 0
+
+    def __init__(self, *args, q_cache_size=0, q_cache_staleness=1,
+                 numpy_inference=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.q_cache = QValueCache(q_cache_size) if q_cache_size > 0 \
+            else None
+        self.q_cache_staleness = q_cache_staleness
+        self.nb_updates_cached = 0
+        self.numpy_model = None
+        self.numpy_model_stale = False
+        if numpy_inference:
+            import inference
+
+            self.numpy_model = inference.DenseNet.from_model(self.model)
+
+    @property
+    def step(self):
+        return self._step
+
+    @step.setter
+    def step(self, value):
+        # fitは始めにstepを0に戻すので、resumeした時はそこから続ける
+        if value == 0 and self.resume_step and getattr(self, 'training',
+                                                       False):
+            value, self.resume_step = self.resume_step, 0
+        self._step = value
+
+    def compute_batch_q_values(self, state_batch):
+        if self.numpy_model is None:
+            return super().compute_batch_q_values(state_batch)
+        if self.numpy_model_stale:
+            self.numpy_model.sync(self.model)
+            self.numpy_model_stale = False
+        return self.numpy_model.predict_on_batch(
+            self.process_state_batch(state_batch))
+
+    def compute_q_values(self, state):
+        if self.q_cache is None:
+            return super().compute_q_values(state)
+        key = np.asarray(state).tobytes()
+        q_values = self.q_cache.get(key)
+        if q_values is None:
+            q_values = super().compute_q_values(state)
+            self.q_cache.put(key, q_values)
+        return q_values
+
+    def load_weights(self, filepath):
+        super().load_weights(filepath)
+        self.numpy_model_stale = True
+        if self.q_cache is not None:
+            self.q_cache.clear()
+
+    def weights_updated(self):
+        """modelを1回学習した後に呼ぶ. numpyの写しとQ値のキャッシュを古くする"""
+        self.numpy_model_stale = True
+        if self.q_cache is not None:
+            self.nb_updates_cached += 1
+            if self.nb_updates_cached >= self.q_cache_staleness:
+                self.q_cache.clear()
+                self.nb_updates_cached = 0
+
+    def backward(self, reward, terminal):
+        # Store most recent experience in memory.
+        if self.step % self.memory_interval == 0:
+            self.memory.append(self.recent_observation, self.recent_action,
+                               reward, terminal, training=self.training)
+
+        metrics = [np.nan for _ in self.metrics_names]
+        if not self.training:
+            return metrics
+
+        if self.step > self.nb_steps_warmup and \
+           self.step % self.train_interval == 0:
+            metrics = self.train_batch()
+
+        if self.target_model_update >= 1 and \
+           self.step % self.target_model_update == 0:
+            self.update_target_model_hard()
+
+        return metrics
+
+    def sample_batch(self):
+        """memoryから (state0, action, reward, state1, terminal1, 重み, 位置)"""
+        if hasattr(self.memory, 'sample_prioritized'):
+            return self.memory.sample_prioritized(self.batch_size)
+        if hasattr(self.memory, 'sample_batch'):
+            batch = self.memory.sample_batch(self.batch_size)
+        else:
+            experiences = self.memory.sample(self.batch_size)
+            batch = tuple(np.array(field) for field in zip(*experiences))
+        return batch + (None, None)
+
+    def train_batch(self, batch=None):
+        """1つのminibatchで学習し、metricsを返す"""
+        if batch is None:
+            batch = self.sample_batch()
+        state0, actions, rewards, state1, terminal1, weights, idxs = batch
+        state0 = self.process_state_batch(state0)
+        state1 = self.process_state_batch(state1)
+        actions = np.asarray(actions, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float32)
+        alive = 1. - np.asarray(terminal1, dtype=np.float32)
+        batch_range = np.arange(len(actions))
+
+        target_q_values = self.target_model.predict_on_batch(state1)
+        if self.enable_double_dqn:
+            q_values = self.model.predict_on_batch(state1)
+            q_batch = target_q_values[batch_range,
+                                      np.argmax(q_values, axis=1)]
+        else:
+            q_batch = np.max(target_q_values, axis=1)
+        Rs = rewards + self.gamma * q_batch * alive
+
+        targets = np.zeros((len(actions), self.nb_actions), dtype=np.float32)
+        masks = np.zeros((len(actions), self.nb_actions), dtype=np.float32)
+        targets[batch_range, actions] = Rs
+        masks[batch_range, actions] = 1.
+        dummy_targets = Rs.astype(np.float32)
+
+        if idxs is not None:
+            # 学習前のQ(s, a)とのずれを新しい優先度にする
+            q0 = self.model.predict_on_batch(state0)[batch_range, actions]
+            self.memory.update_priorities(idxs, Rs - q0)
+        sample_weight = None
+        if weights is not None:
+            sample_weight = [weights, np.ones_like(weights)]
+
+        ins = [state0] if type(self.model.input) is not list else state0
+        metrics = self.trainable_model.train_on_batch(
+            ins + [targets, masks], [dummy_targets, targets],
+            sample_weight=sample_weight)
+        self.weights_updated()
+        # throw away individual losses
+        metrics = [metric for idx, metric in enumerate(metrics)
+                   if idx not in (1, 2)]
+        metrics += self.policy.metrics
+        if self.processor is not None:
+            metrics += self.processor.metrics
+        return metrics
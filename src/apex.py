@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""複数のactorプロセスでenvを動かし、1つのlearnerで学習する(Ape-X風)
+
+actorはcreate_modelで作ったモデルの写しで行動を選び、遷移を共有メモリ上の
+TransitionChannelに書く. learner(呼び出し元のプロセス)はそれを自分の
+replay memoryに移してDQNAgent.train_batchで学習し、重みをWeightBoardに
+書き出す. actorは一定step毎にWeightBoardから重みを読み直す.
+
+actorはBLASやTensorFlowのスレッドを1本に絞って起動するので、
+actor数+1のコアがあればstep/秒はactor数にほぼ比例して増える.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing import get_context, shared_memory
+
+import gym.spaces
+import numpy as np
+
+import myenv
+import replay
+
+# 子プロセスのスレッド数を決める環境変数
+THREAD_ENVIRON = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                  'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+                  'TF_NUM_INTEROP_THREADS')
+
+
+@contextmanager
+def thread_limit(threads):
+    """この間に起動した子プロセスのBLAS/TensorFlowのスレッド数をthreadsにする"""
+    saved = {name: os.environ.get(name) for name in THREAD_ENVIRON}
+    os.environ.update({name: str(threads) for name in THREAD_ENVIRON})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name)
+            else:
+                os.environ[name] = value
+
+
+def _aligned(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class TransitionChannel(object):
+    """1つのactorからlearnerへ遷移を送る共有メモリ上のリングバッファ
+
+    書き手(actor)と読み手(learner)は1つずつ. 書き手はslotを埋めてから
+    headを、読み手は読み終えてからtailを進める. head, tailは単調に増える.
+    """
+    # counters: head, tail, 環境のstep数, エピソード数
+    HEAD, TAIL, STEPS, EPISODES = range(4)
+
+    def __init__(self, obs_shape, obs_dtype, capacity=4096):
+        self.obs_shape = tuple(obs_shape)
+        self.obs_dtype = np.dtype(obs_dtype)
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=self._size())
+        self._owner = True
+        self._views()
+        self.counters[:] = 0
+
+    def _layout(self):
+        fields = [('counters', (4,), np.int64),
+                  ('observations', (self.capacity,) + self.obs_shape,
+                   self.obs_dtype),
+                  ('actions', (self.capacity,), np.int32),
+                  ('rewards', (self.capacity,), np.float32),
+                  ('terminals', (self.capacity,), np.bool_)]
+        offset = 0
+        for name, shape, dtype in fields:
+            yield name, shape, dtype, offset
+            offset = _aligned(offset + int(np.prod(shape))
+                              * np.dtype(dtype).itemsize)
+
+    def _size(self):
+        name, shape, dtype, offset = list(self._layout())[-1]
+        return max(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize,
+                   1)
+
+    def _views(self):
+        for name, shape, dtype, offset in self._layout():
+            setattr(self, name, np.ndarray(shape, dtype=dtype,
+                                           buffer=self.shm.buf,
+                                           offset=offset))
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'obs_shape': self.obs_shape,
+                'obs_dtype': self.obs_dtype.str, 'capacity': self.capacity}
+
+    def __setstate__(self, state):
+        self.obs_shape = state['obs_shape']
+        self.obs_dtype = np.dtype(state['obs_dtype'])
+        self.capacity = state['capacity']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+        self._views()
+
+    def put(self, observation, action, reward, terminal, stop=None):
+        """遷移を1つ書く. 満杯なら空くまで待ち、stopが立てばFalseを返す"""
+        head = int(self.counters[self.HEAD])
+        while head - int(self.counters[self.TAIL]) >= self.capacity:
+            if stop is not None and stop.is_set():
+                return False
+            time.sleep(0.001)
+        slot = head % self.capacity
+        self.observations[slot] = observation
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.terminals[slot] = terminal
+        self.counters[self.HEAD] = head + 1
+        return True
+
+    def drain(self):
+        """溜まっている遷移を全部取り出す. 無ければNone"""
+        head = int(self.counters[self.HEAD])
+        tail = int(self.counters[self.TAIL])
+        if head == tail:
+            return None
+        slots = (tail + np.arange(head - tail)) % self.capacity
+        batch = (self.observations[slots], self.actions[slots],
+                 self.rewards[slots], self.terminals[slots])
+        self.counters[self.TAIL] = head
+        return batch
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def close(self):
+        for name, _, _, _ in self._layout():
+            setattr(self, name, None)
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+class WeightBoard(object):
+    """learnerの重みをactorに配る共有メモリ
+
+    versionが奇数の間はlearnerが書き込み中. 読み手は読む前後でversionが
+    同じ偶数であることを確かめ、違えば読み直しを次の機会に回す.
+    """
+
+    def __init__(self, weights):
+        self.shapes = [np.shape(w) for w in weights]
+        self.sizes = [int(np.prod(s)) for s in self.shapes]
+        size = 8 + 4 * sum(self.sizes)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self._owner = True
+        self._views()
+        self.version[0] = 0
+        self.publish(weights)
+
+    def _views(self):
+        self.version = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.flat = np.ndarray((sum(self.sizes),), dtype=np.float32,
+                               buffer=self.shm.buf, offset=8)
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'shapes': self.shapes}
+
+    def __setstate__(self, state):
+        self.shapes = state['shapes']
+        self.sizes = [int(np.prod(s)) for s in self.shapes]
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+        self._views()
+
+    def publish(self, weights):
+        version = int(self.version[0])
+        self.version[0] = version + 1
+        self.flat[:] = np.concatenate(
+            [np.ravel(w) for w in weights]).astype(np.float32)
+        self.version[0] = version + 2
+
+    def read(self, known=-1):
+        """(重みのリスト, version). knownから変わっていなければ (None, known)"""
+        version = int(self.version[0])
+        if version == known or version % 2:
+            return None, known
+        flat = self.flat.copy()
+        if int(self.version[0]) != version:
+            return None, known
+        weights = np.split(flat, np.cumsum(self.sizes)[:-1])
+        return [w.reshape(s) for w, s in zip(weights, self.shapes)], version
+
+    def close(self):
+        self.version = self.flat = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def actor_epsilons(nb_actors, epsilon=0.4, alpha=7.):
+    """Ape-Xのactor毎のε (epsilon ** (1 + alpha * i / (N - 1)))"""
+    if nb_actors == 1:
+        return [epsilon]
+    return [epsilon ** (1 + alpha * i / (nb_actors - 1))
+            for i in range(nb_actors)]
+
+
+def run_actor(env_name, env_kwargs, model_factory, channel, board,
+              epsilon, seed, window_length, sync_interval, stop,
+              numpy_inference=False):
+    """actorプロセスの本体. stopが立つまでenvを動かし続ける
+
+    numpy_inference なら行動選択にはinference.DenseNetを使い、
+    WeightBoardの重みもそちらに写す.
+    """
+    np.random.seed(seed)
+    gym.spaces.prng.seed(seed)
+    env = myenv.make(env_name, **env_kwargs)
+    env.seed(seed)
+    nb_actions = env.action_space.n
+    model = model_factory(env, nb_actions, window_length)
+    if numpy_inference:
+        import inference
+
+        model = inference.DenseNet.from_model(model)
+    # learnerがpublishの途中(versionが奇数)だと読めないので、読めるまで待つ
+    weights, version = board.read()
+    while weights is None:
+        if stop.is_set():
+            return
+        time.sleep(0.001)
+        weights, version = board.read()
+    model.set_weights(weights)
+
+    step = 0
+    while not stop.is_set():
+        observation = env.reset()
+        recent = [np.zeros_like(observation)] * (window_length - 1) + \
+            [observation]
+        done = False
+        while not done:
+            if step % sync_interval == 0:
+                weights, version = board.read(version)
+                if weights is not None:
+                    model.set_weights(weights)
+            if np.random.random_sample() < epsilon:
+                action = np.random.randint(nb_actions)
+            else:
+                q_values = model.predict_on_batch(np.array([recent]))
+                action = int(np.argmax(q_values[0]))
+            next_observation, reward, done, _ = env.step(action)
+            if not channel.put(observation, action, reward, done, stop):
+                return
+            channel.count(channel.STEPS)
+            step += 1
+            observation = next_observation
+            recent = recent[1:] + [observation]
+        # dqn.fitと同じく、終端の観測も行動0報酬0で1件入れておく
+        if not channel.put(observation, 0, 0., False, stop):
+            return
+        channel.count(channel.EPISODES)
+
+
+def train(dqn, env_name, env_kwargs, model_factory, nb_actors, nb_steps,
+          seed=123, sync_interval=100, publish_interval=50,
+          channel_capacity=4096, log_interval=10., verbose=1,
+          numpy_inference=False):
+    """nb_actors個のactorで合計nb_stepsだけenvを動かしながらdqnを学習する
+
+    numpy_inference ならactorはkerasの代わりにinference.DenseNetで
+    行動を選ぶ. replay memoryはactor毎のRingMemoryをShardedMemoryで束ねたものに
+    置き換える(大きさはdqn.memory.limitをactorで等分). そのため
+    prioritized等の種類やMemmapStorageは引き継がない(myenv_dqnで断る).
+    """
+    env = myenv.make(env_name, **env_kwargs)
+    obs_space = env.observation_space
+    env.close()
+
+    window_length = dqn.memory.window_length
+    if hasattr(dqn.memory, 'close'):
+        dqn.memory.close()
+    dqn.memory = replay.ShardedMemory([
+        replay.RingMemory(dqn.memory.limit // nb_actors,
+                          window_length=window_length)
+        for _ in range(nb_actors)])
+    dqn.training = True
+    dqn.step = 0
+
+    context = get_context('spawn')
+    stop = context.Event()
+    board = WeightBoard(dqn.model.get_weights())
+    channels = [TransitionChannel(obs_space.shape, obs_space.dtype,
+                                  channel_capacity)
+                for _ in range(nb_actors)]
+    actors = [context.Process(
+        target=run_actor, daemon=True,
+        args=(env_name, env_kwargs, model_factory, channel, board,
+              epsilon, seed + i, window_length, sync_interval, stop,
+              numpy_inference))
+        for i, (channel, epsilon) in enumerate(
+            zip(channels, actor_epsilons(nb_actors)))]
+
+    with thread_limit(1):
+        for actor in actors:
+            actor.start()
+
+    start = last_log = time.time()
+    steps = updates = episodes = 0
+    try:
+        while steps < nb_steps:
+            received = 0
+            for channel, shard in zip(channels, dqn.memory.shards):
+                batch = channel.drain()
+                if batch is not None:
+                    shard.extend(*batch)
+                    received += len(batch[1])
+            steps = sum(int(c.counters[c.STEPS]) for c in channels)
+            episodes = sum(int(c.counters[c.EPISODES]) for c in channels)
+            dqn.step = steps
+
+            if steps > dqn.nb_steps_warmup and all(
+                    shard.nb_entries > window_length + 1
+                    for shard in dqn.memory.shards):
+                dqn.train_batch()
+                updates += 1
+                if dqn.target_model_update >= 1 and \
+                   updates % dqn.target_model_update == 0:
+                    dqn.update_target_model_hard()
+                if updates % publish_interval == 0:
+                    board.publish(dqn.model.get_weights())
+            elif not received:
+                if not any(actor.is_alive() for actor in actors):
+                    raise RuntimeError('all actors have exited')
+                time.sleep(0.001)
+
+            now = time.time()
+            if verbose and now - last_log >= log_interval:
+                last_log = now
+                print('{} steps ({:.0f} steps/s), {} updates, {} episodes'
+                      .format(steps, steps / (now - start), updates,
+                              episodes))
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=10)
+            if actor.is_alive():
+                actor.terminate()
+        for channel in channels:
+            channel.close()
+        board.close()
+
+    seconds = time.time() - start
+    if verbose:
+        print('done, took {:.3f} seconds ({:.0f} steps/s, {} updates)'
+              .format(seconds, steps / seconds, updates))
+    return {'nb_steps': steps, 'nb_updates': updates,
+            'nb_episodes': episodes, 'seconds': seconds}
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""envAdの配列実装とbitboard実装の1手あたりの処理時間を比べる
+
+    cd src && python -m benchmarks.bench_bitboard
+"""
+
+import argparse
+import timeit
+import numpy as np
+
+from myenv.bitboard import BitBoard, CELLS
+
+# 配列実装で勝ちを判定していたライン(縦横10本の座標)
+WIN_MAP = np.array(
+    [[[row, col] for col in range(5)] for row in range(5)] +
+    [[[row, col] for row in range(5)] for col in range(5)])
+
+
+def array_move(board, player, cell, win_map):
+    """配列実装: マスの確認、石を置く、_find_posと全ライン比較"""
+    coord = divmod(cell, 5)
+    is_miss = board[coord] != 2
+    board[coord] = player
+    pos = np.array(list(zip(*np.where(board == player))))
+    is_win = len(pos) > 0 and bool(np.any(np.all(
+        board[win_map[..., 0], win_map[..., 1]] == player, axis=1)))
+    is_draw = not np.any(board == 2)
+    return is_miss, is_win, is_draw
+
+
+def bitboard_move(board, player, cell):
+    """bitboard実装: 置く、miss、勝ち、引き分けがそれぞれbit演算"""
+    is_miss = board.place(player, cell)
+    is_win = board.is_win(player, cell)
+    is_draw = board.is_full()
+    return is_miss, is_win, is_draw
+
+
+def play_array(moves, win_map):
+    board = np.full((5, 5), 2)
+    for turn, cell in enumerate(moves):
+        array_move(board, turn % 2, cell, win_map)
+
+
+def play_bitboard(moves, board):
+    board.reset()
+    for turn, cell in enumerate(moves):
+        bitboard_move(board, turn % 2, cell)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=2000,
+                        help='games per measurement')
+    parser.add_argument('-d', '--diagonals', action='store_true',
+                        help='include diagonal win lines')
+    args = parser.parse_args()
+
+    moves = np.random.RandomState(0).permutation(CELLS).tolist()
+    win_map = WIN_MAP
+    board = BitBoard(diagonals=args.diagonals)
+
+    array_time = timeit.timeit(lambda: play_array(moves, win_map),
+                               number=args.number)
+    bit_time = timeit.timeit(lambda: play_bitboard(moves, board),
+                             number=args.number)
+    nb_moves = args.number * CELLS
+    print('array   : {:8.3f} us/move'.format(array_time / nb_moves * 1e6))
+    print('bitboard: {:8.3f} us/move'.format(bit_time / nb_moves * 1e6))
+    print('speedup : {:8.1f}x'.format(array_time / bit_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""観測値の作り方ごとに、1stepあたりの確保メモリと時間を比べる
+
+    cd src && python -m benchmarks.bench_observation
+
+legacy は以前の _observe (毎step MAP.copy() して勇者/敵を重ねる) を再現したもの.
+"""
+
+import argparse
+import time
+import tracemalloc
+import numpy as np
+
+from myenv import sampleEnv, env, envAd
+
+ENVS = {
+    'myenv-v0': sampleEnv.MyEnv,
+    'myenv-v1': env.MyEnv,
+    'myenv-v2': envAd.MyEnv,
+}
+
+
+def legacy_observe(target):
+    """MAP.copy() に勇者(と敵)を重ねる以前の実装"""
+    observation = target.MAP.copy()
+    if hasattr(target, 'pos'):
+        observation[tuple(target.pos)] = target.FIELD_TYPES.index('Y')
+    if hasattr(target, 'mon_pos'):
+        observation[tuple(target.mon_pos.T)] = target.FIELD_TYPES.index('M')
+    return observation
+
+
+def measure(env_class, mode, nb_steps, seed=0):
+    """1stepあたりの一時確保バイト数(ピーク)と時間を返す"""
+    target = env_class(obs_mode='view' if mode == 'view' else 'buffer')
+    if mode == 'legacy':
+        target._observe = lambda: legacy_observe(target)
+    np.random.seed(seed)
+    actions = np.random.randint(target.action_space.n, size=nb_steps)
+    target._reset()
+
+    allocated = 0
+    tracemalloc.start()
+    for action in actions:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        _, _, done, _ = target._step(action)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+        if done:
+            target._reset()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for action in actions:
+        _, _, done, _ = target._step(action)
+        if done:
+            target._reset()
+    elapsed = time.perf_counter() - start
+    return allocated / nb_steps, elapsed / nb_steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--nb-steps', type=int, default=5000,
+                        help='steps per measurement')
+    args = parser.parse_args()
+
+    print('{:10s} {:8s} {:>14s} {:>10s}'.format(
+        'env', 'mode', 'bytes/step', 'us/step'))
+    for name, env_class in ENVS.items():
+        for mode in ('legacy', 'buffer', 'view'):
+            nbytes, seconds = measure(env_class, mode, args.nb_steps)
+            print('{:10s} {:8s} {:14.1f} {:10.2f}'.format(
+                name, mode, nbytes, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""SumTreeの引く/優先度更新の速さ(1秒あたりのbatch数)を容量ごとに測る
+
+    cd src && python -m benchmarks.bench_prioritized
+    cd src && python -m benchmarks.bench_prioritized -c 50000 1000000
+
+10Mの木は約270MBを使う.
+"""
+
+import argparse
+import timeit
+import numpy as np
+
+from replay import SumTree, PrioritizedMemory
+
+
+def bench_tree(capacity, batch_size, number):
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), np.random.random_sample(capacity))
+
+    def sample():
+        segment = tree.total / batch_size
+        return tree.find((np.arange(batch_size)
+                          + np.random.random_sample(batch_size)) * segment)
+
+    idxs = sample()
+
+    def update():
+        tree.update(idxs, np.random.random_sample(batch_size))
+
+    sample_time = timeit.timeit(sample, number=number) / number
+    update_time = timeit.timeit(update, number=number) / number
+    return sample_time, update_time, tree.nbytes
+
+
+def bench_memory(limit, batch_size, number):
+    memory = PrioritizedMemory(limit, window_length=1)
+    random = np.random.RandomState(0)
+    for i in range(limit):
+        memory.append(random.randint(0, 8, size=(7, 12)).astype(np.uint8),
+                      i % 4, -1., random.random_sample() < 0.02)
+    batch = memory.sample_prioritized(batch_size)
+    errors = np.random.randn(batch_size)
+    sample_time = timeit.timeit(
+        lambda: memory.sample_prioritized(batch_size),
+        number=number) / number
+    update_time = timeit.timeit(
+        lambda: memory.update_priorities(batch[-1], errors),
+        number=number) / number
+    return sample_time, update_time, memory.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--capacities', type=int, nargs='+',
+                        default=[50000, 1000000, 10000000],
+                        help='tree capacities')
+    parser.add_argument('-b', '--batch-size', type=int, default=32,
+                        help='batch size')
+    parser.add_argument('-n', '--number', type=int, default=2000,
+                        help='batches per measurement')
+    args = parser.parse_args()
+
+    row = '{:28s} {:>12.0f} {:>12.0f} {:>14,}'
+    print('{:28s} {:>12s} {:>12s} {:>14s}'.format(
+        'target', 'sample b/s', 'update b/s', 'bytes'))
+    for capacity in args.capacities:
+        sample_time, update_time, nbytes = bench_tree(
+            capacity, args.batch_size, args.number)
+        print(row.format('SumTree({:,})'.format(capacity),
+                         1 / sample_time, 1 / update_time, nbytes))
+    sample_time, update_time, nbytes = bench_memory(
+        50000, args.batch_size, args.number)
+    print(row.format('PrioritizedMemory(50,000)',
+                     1 / sample_time, 1 / update_time, nbytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""満杯のreplay memoryから32件ずつ引く速さとメモリ量を比べる
+
+    cd src && python -m benchmarks.bench_replay
+"""
+
+import argparse
+import sys
+import timeit
+import numpy as np
+
+from rl.memory import SequentialMemory
+
+from replay import RingMemory
+
+
+def fill(memory, limit, shape, seed=0):
+    random = np.random.RandomState(seed)
+    observations = random.randint(0, 8, size=(limit,) + shape) \
+        .astype(np.uint8)
+    terminals = random.random_sample(limit) < 0.02
+    for i in range(limit):
+        memory.append(observations[i], i % 4, -1., terminals[i])
+
+
+def sequential_nbytes(memory):
+    """SequentialMemoryが持つPythonオブジェクトのおおよそのバイト数"""
+    nbytes = 0
+    for buffer in (memory.observations, memory.actions, memory.rewards,
+                   memory.terminals):
+        nbytes += sys.getsizeof(buffer.data)
+        for i in range(len(buffer)):
+            nbytes += sys.getsizeof(buffer[i])
+    return nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-l', '--limit', type=int, default=50000,
+                        help='memory limit')
+    parser.add_argument('-b', '--batch-size', type=int, default=32,
+                        help='batch size')
+    parser.add_argument('-wl', '--window-length', type=int, default=1,
+                        help='window length')
+    parser.add_argument('-n', '--number', type=int, default=2000,
+                        help='batches per measurement')
+    args = parser.parse_args()
+
+    shape = (7, 12)
+    sequential = SequentialMemory(limit=args.limit,
+                                  window_length=args.window_length)
+    ring = RingMemory(args.limit, window_length=args.window_length)
+    fill(sequential, args.limit, shape)
+    fill(ring, args.limit, shape)
+
+    results = [
+        ('SequentialMemory.sample',
+         lambda: sequential.sample(args.batch_size)),
+        ('RingMemory.sample',
+         lambda: ring.sample(args.batch_size)),
+        ('RingMemory.sample_batch',
+         lambda: ring.sample_batch(args.batch_size)),
+    ]
+    base = None
+    for name, func in results:
+        seconds = timeit.timeit(func, number=args.number) / args.number
+        base = base or seconds
+        print('{:26s} {:10.1f} us/batch {:8.1f}x'.format(
+            name, seconds * 1e6, base / seconds))
+    print('SequentialMemory bytes: {:,}'.format(sequential_nbytes(sequential)))
+    print('RingMemory bytes      : {:,}'.format(ring.nbytes))
+
+
+if __name__ == '__main__':
+    main()
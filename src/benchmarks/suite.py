@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""envとDQNの学習の速さをまとめて測り、JSONに残す. 前の結果と比べられる
+
+    cd src && python -m benchmarks.suite -o baseline.json
+    cd src && python -m benchmarks.suite -o new.json --compare baseline.json
+
+測るもの(envはランダムな行動で、gym.makeで包んだもの):
+    env_steps   : 1秒あたりのstep数(終わったらresetも含む)
+    reset       : 1回のresetの時間
+    obs_alloc   : 1stepあたりに一時確保するバイト数
+    fit_steps   : myenv_dqn.create_dqnのエージェントを短くfitした時の
+                  1秒あたりのstep数 (--skip-fitで省く)
+時間を測るものは、1回をmin_time秒以上続け、それをrepeat回(最初に捨てる
+1回を除く)繰り返した中央値とばらつき(中央値からの偏差の中央値, 相対値)を残す.
+compareでは tolerance と 両方のばらつきから見た雑音の幅 の大きい方より
+悪くなったものをREGRESSIONとし、終了コードを1にする.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+import myenv
+from benchmarks import bench_observation
+
+ENV_IDS = ('myenv-v0', 'myenv-v1', 'myenv-v2', 'myenv-v3')
+# min_timeに達したかはこの回数ごとに見る
+STEP_CHUNK = 1000
+RESET_CHUNK = 100
+# 中央値からの偏差の中央値 -> 標準偏差 (正規分布の時)
+MAD_TO_SIGMA = 1.4826
+# 雑音とみなす幅(1回ごとの標準偏差の何倍か)
+NOISE_SIGMAS = 3.
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """env(envAdのreset等)のprintを捨てる"""
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        yield
+
+
+def env_steps(env_id, min_time, seed=0):
+    env = myenv.make(env_id)
+    env.seed(seed)
+    np.random.seed(seed)
+    env.reset()
+    nb_steps = 0
+    start = time.perf_counter()
+    while True:
+        for action in np.random.randint(env.action_space.n,
+                                        size=STEP_CHUNK):
+            _, _, done, _ = env.step(action)
+            if done:
+                env.reset()
+        nb_steps += STEP_CHUNK
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return nb_steps / elapsed
+
+
+def reset_cost(env_id, min_time):
+    env = myenv.make(env_id)
+    number = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(RESET_CHUNK):
+            env.reset()
+        number += RESET_CHUNK
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / number
+
+
+def obs_alloc(env_id, nb_steps):
+    env = myenv.make(env_id)
+    nbytes, _ = bench_observation.measure(
+        type(env.unwrapped), 'buffer', nb_steps)
+    return nbytes
+
+
+def fit_steps(env_id, nb_steps, seed=0):
+    import myenv_dqn
+
+    args = myenv_dqn.myperser().parse_args(
+        ['--env', env_id, '-s', str(nb_steps), '-wu', '100'])
+    env = myenv.make(env_id)
+    np.random.seed(seed)
+    env.seed(seed)
+    dqn = myenv_dqn.create_dqn(args, env)
+    start = time.perf_counter()
+    dqn.fit(env, nb_steps=nb_steps, visualize=False, verbose=0)
+    return nb_steps / (time.perf_counter() - start)
+
+
+def summarize(values):
+    """(中央値, 中央値に対するばらつきの相対値)"""
+    values = np.asarray(values, dtype=np.float64)
+    median = float(np.median(values))
+    if median == 0.:
+        return median, 0.
+    return median, float(np.median(np.abs(values - median)) / abs(median))
+
+
+def run(env_ids, nb_steps, min_time, fit_nb_steps, skip_fit=False,
+        repeat=7, fit_repeat=3):
+    """{名前: {'value', 'spread', 'values', 'unit', 'better'}}
+
+    valueはrepeat回の中央値. 最初の1回(読み込みやキャッシュの温まり)は捨てる.
+    """
+    results = {}
+
+    def put(name, func, unit, better, repeat=repeat):
+        with quiet():
+            if repeat > 1:
+                func()
+            values = [func() for _ in range(repeat)]
+        value, spread = summarize(values)
+        results[name] = {'value': value, 'spread': spread,
+                         'values': [float(v) for v in values],
+                         'unit': unit, 'better': better}
+        print('{:28s} {:14.2f} {:10s} +-{:.1%}'.format(
+            name, value, unit, spread))
+
+    for env_id in env_ids:
+        put('env_steps/' + env_id, lambda: env_steps(env_id, min_time),
+            'steps/s', 'higher')
+        put('reset/' + env_id, lambda: reset_cost(env_id, min_time) * 1e6,
+            'us', 'lower')
+        put('obs_alloc/' + env_id, lambda: obs_alloc(env_id, nb_steps),
+            'bytes/step', 'lower', repeat=1)
+    if not skip_fit:
+        for env_id in env_ids:
+            put('fit_steps/' + env_id,
+                lambda: fit_steps(env_id, fit_nb_steps), 'steps/s', 'higher',
+                repeat=fit_repeat)
+    return results
+
+
+def run_spread(results):
+    """1回の実行の中で時間を測ったもののばらつきの中央値(その時の機械の揺れ)"""
+    spreads = [result['spread'] for result in results.values()
+               if len(result.get('values', ())) > 1]
+    return float(np.median(spreads)) if spreads else 0.
+
+
+def noise(old, new, old_floor=0., new_floor=0.):
+    """2つの結果の差のうち雑音とみなす幅(相対値)
+
+    それぞれのばらつきは、そのベンチマーク自身のものと、同じ実行の中の
+    ばらつきの中央値(floor)の大きい方. 7回程のばらつきは偶然小さく出るし、
+    別の時に測ったbaselineとの間には機械全体の揺れも入るので.
+    """
+    sigma = MAD_TO_SIGMA * np.hypot(max(old.get('spread', 0.), old_floor),
+                                    max(new.get('spread', 0.), new_floor))
+    return NOISE_SIGMAS * float(sigma)
+
+
+def compare(results, baseline, tolerance):
+    """baselineと比べた表を出し、悪くなったものの名前のリストを返す"""
+    regressions = []
+    old_floor, new_floor = run_spread(baseline), run_spread(results)
+    print('{:28s} {:>14s} {:>14s} {:>9s} {:>9s}'.format(
+        'benchmark', 'baseline', 'current', 'change', 'allowed'))
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], result['value']
+        change = (new - old) / old if old else 0.
+        worse = -change if result['better'] == 'higher' else change
+        allowed = tolerance
+        if len(result.get('values', ())) > 1:
+            allowed = max(tolerance, noise(baseline[name], result,
+                                           old_floor, new_floor))
+        flag = ''
+        if worse > allowed:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print('{:28s} {:14.2f} {:14.2f} {:+9.1%} {:9.1%} {}'.format(
+            name, old, new, change, allowed, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--envs', nargs='+', default=list(ENV_IDS),
+                        help='env ids')
+    parser.add_argument('-n', '--nb-steps', type=int, default=20000,
+                        help='steps of the obs_alloc measurement')
+    parser.add_argument('-m', '--min-time', type=float, default=0.5,
+                        help='seconds each env_steps/reset run lasts at '
+                             'least')
+    parser.add_argument('-f', '--fit-steps', type=int, default=5000,
+                        help='steps of the end-to-end fit')
+    parser.add_argument('-k', '--skip-fit', action='store_true',
+                        help='skip the end-to-end fit (no keras needed)')
+    parser.add_argument('-R', '--repeat', type=int, default=7,
+                        help='keep the median of this many runs')
+    parser.add_argument('-F', '--fit-repeat', type=int, default=3,
+                        help='runs of the end-to-end fit')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('-c', '--compare', default=None,
+                        help='baseline JSON written by an earlier run')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='allowed slowdown before flagging (0.1 = '
+                             '10%%), raised to the measured noise')
+    args = parser.parse_args()
+
+    results = run(args.envs, args.nb_steps, args.min_time, args.fit_steps,
+                  args.skip_fit, args.repeat, args.fit_repeat)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(), 'results': results}, f,
+                      indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['machine'].get('platform') != platform.platform():
+            print('warning: baseline was measured on {}'.format(
+                baseline['machine'].get('platform')))
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
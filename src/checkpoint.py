@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""学習の途中の状態を定期的にファイルに書き、--resumeでそこから続ける
+
+1つのcheckpointは次のものを入れた .npz:
+    model_*, target_*   : online / target modelの重み
+    optimizer_*         : optimizerの重み(Adamのモーメント等)
+    random_keys         : np.randomの状態(探索の乱数)
+    meta                : step, policyの設定(tau, eps等), np.randomの残りをJSONで
+重みのコピーは学習ループの中でとるが、ファイルへの書き込みは別スレッドで行い、
+一時ファイルに書いてからos.replaceで置き換えるので、書きかけのファイルは残らない.
+書き込みが追い付かない時は、待たせずに古い方を捨てて新しい方だけ書く.
+
+    cb = CheckpointCallback(CheckpointWriter('checkpoints_myenv-v0'), 10000)
+    dqn.fit(env, nb_steps, callbacks=[cb])
+    restore(dqn, latest('checkpoints_myenv-v0'))
+"""
+
+import glob
+import json
+import os
+import queue
+import tempfile
+import threading
+
+import numpy as np
+import rl.callbacks
+
+PREFIX = 'checkpoint_'
+SUFFIX = '.npz'
+
+
+def checkpoint_path(directory, step):
+    return os.path.join(directory, '{}{:09d}{}'.format(PREFIX, step, SUFFIX))
+
+
+def list_checkpoints(directory):
+    """directoryにあるcheckpointのpathをstep順に返す"""
+    return sorted(glob.glob(os.path.join(directory, PREFIX + '*' + SUFFIX)))
+
+
+def latest(directory):
+    """一番新しいcheckpointのpath. 無ければNone"""
+    paths = list_checkpoints(directory)
+    return paths[-1] if paths else None
+
+
+def optimizer_of(dqn):
+    """学習に使うoptimizer. target_model_update < 1 の時はkeras-rlが
+    AdditionalUpdatesOptimizerで包む(それ自身の重みは空)ので中身を返す"""
+    optimizer = dqn.trainable_model.optimizer
+    return getattr(optimizer, 'optimizer', optimizer)
+
+
+def has_trained(meta):
+    """checkpointのstepまでに1回でも学習したか(optimizerの重みがあるはずか)"""
+    warmup, interval = meta.get('warmup'), meta.get('train_interval', 1)
+    if warmup is None:
+        return False
+    # fitはstep > warmup かつ step % interval == 0 の時に学習する
+    first = (warmup // interval + 1) * interval
+    return first < meta['step']
+
+
+def policy_state(policy):
+    """policyの数値や文字列の属性(tau, eps, 焼きなましの値等)"""
+    return {name: value for name, value in vars(policy).items()
+            if isinstance(value, (bool, int, float, str))}
+
+
+def snapshot(dqn, step=None):
+    """dqnの今の状態を {名前: 配列} にする(ファイルには書かない).
+    stepは終わったstep数(省略するとdqn.step)"""
+    arrays = {}
+    for name, weights in (('model', dqn.model.get_weights()),
+                          ('target', dqn.target_model.get_weights()),
+                          ('optimizer', optimizer_of(dqn).get_weights())):
+        for i, weight in enumerate(weights):
+            arrays['{}_{}'.format(name, i)] = np.array(weight)
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays['random_keys'] = keys.copy()
+    meta = {'step': int(dqn.step if step is None else step),
+            'warmup': int(dqn.nb_steps_warmup),
+            'train_interval': int(dqn.train_interval),
+            'policy': policy_state(dqn.policy),
+            'random': [int(pos), int(has_gauss), float(cached_gaussian)]}
+    arrays['meta'] = np.array(json.dumps(meta))
+    return arrays
+
+
+def save(arrays, path):
+    """一時ファイルに書いてから置き換える"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load(path):
+    """(meta, {名前: 配列})"""
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    meta = json.loads(str(arrays.pop('meta')))
+    return meta, arrays
+
+
+def _weights(arrays, name):
+    weights = []
+    while '{}_{}'.format(name, len(weights)) in arrays:
+        weights.append(arrays['{}_{}'.format(name, len(weights))])
+    return weights
+
+
+def restore(dqn, path):
+    """pathのcheckpointをdqnに戻し、そのstepを返す
+
+    次のfitはそのstepから数え始める(MyDQNAgent.resume_step). memoryが
+    空の時(--memory-dirで持ち越していない時)は、そこからもう一度warmupする.
+    """
+    meta, arrays = load(path)
+    dqn.model.set_weights(_weights(arrays, 'model'))
+    dqn.target_model.set_weights(_weights(arrays, 'target'))
+    optimizer_weights = _weights(arrays, 'optimizer')
+    if not optimizer_weights and has_trained(meta):
+        raise ValueError('{} was taken after training began but has no '
+                         'optimizer state'.format(path))
+    optimizer = optimizer_of(dqn)
+    if optimizer_weights and not optimizer.weights and \
+            hasattr(dqn.trainable_model, '_make_train_function'):
+        # optimizerの重みは最初の学習の時に作られるので、先に作っておく
+        dqn.trainable_model._make_train_function()
+    optimizer.set_weights(optimizer_weights)
+
+    for name, value in meta['policy'].items():
+        setattr(dqn.policy, name, value)
+    pos, has_gauss, cached_gaussian = meta['random']
+    np.random.set_state(('MT19937', arrays['random_keys'], pos, has_gauss,
+                         cached_gaussian))
+
+    step = meta['step']
+    dqn.resume_step = step
+    if getattr(dqn.memory, 'nb_entries', 0) == 0:
+        dqn.nb_steps_warmup += step
+    if hasattr(dqn, 'weights_updated'):
+        dqn.weights_updated()
+    return step
+
+
+class CheckpointWriter(object):
+    """snapshotを別スレッドでdirectoryに書き、新しい方からkeep個だけ残す"""
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+        self.queue = queue.Queue(maxsize=1)
+        self.nb_written = 0
+        self.nb_dropped = 0
+        self.error = None
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            step, arrays = item
+            try:
+                save(arrays, checkpoint_path(self.directory, step))
+                for path in list_checkpoints(self.directory)[:-self.keep]:
+                    os.remove(path)
+                self.nb_written += 1
+            except Exception as e:
+                self.error = e
+
+    def put(self, step, arrays):
+        """書き込み待ちがあればそれを捨てて入れ替える(待たない)"""
+        if self.error is not None:
+            raise self.error
+        while True:
+            try:
+                self.queue.put_nowait((step, arrays))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.nb_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        """残りを書き終わるまで待つ"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            raise self.error
+
+
+class CheckpointCallback(rl.callbacks.Callback):
+    """interval step毎と学習の終わりにcheckpointを書く"""
+
+    def __init__(self, writer, interval=10000):
+        self.writer = writer
+        self.interval = interval
+        self.last_step = None
+
+    def on_step_end(self, step, logs):
+        # fitはon_step_endの後でstepを進めるので、終わったstep数は+1
+        done = int(self.model.step) + 1
+        if done % self.interval == 0:
+            self.checkpoint(done)
+
+    def on_train_end(self, logs):
+        if self.last_step != int(self.model.step):
+            self.checkpoint(int(self.model.step))
+        self.writer.close()
+
+    def checkpoint(self, step):
+        self.last_step = step
+        self.writer.put(step, snapshot(self.model, step))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""学習済みの重みでTESTのepisodeを複数プロセスに分けて走らせる
+
+episode i の乱数(np.random, gym.spaces.prng, env.seed)は seed と i だけから
+決めるので、workerの数や割り振りが変わっても結果は同じになる.
+行動はgreedy(DQNAgentのtest_policyと同じ)で、描画はしない.
+"""
+
+from multiprocessing import get_context
+
+import gym.spaces
+import numpy as np
+
+import inference
+import myenv
+
+# workerプロセス毎に1つだけ作るenvとモデル
+_worker = {}
+
+
+def episode_seed(seed, episode):
+    """seedとepisode番号から、そのepisodeの乱数の種を作る"""
+    sequence = np.random.SeedSequence(seed, spawn_key=(episode,))
+    return int(sequence.generate_state(1)[0])
+
+
+def init_worker(env_name, env_kwargs, model_factory, weights_path,
+                window_length, max_steps, numpy_inference=False):
+    """envとモデルを作り、重みを1回だけ読む.
+    model_factoryがNoneなら weights_path はinference.DenseNet.saveで
+    書き出したファイルで、kerasは使わない"""
+    env = myenv.make(env_name, **env_kwargs)
+    if model_factory is None:
+        model = inference.load(weights_path)
+    else:
+        model = model_factory(env, env.action_space.n, window_length)
+        model.load_weights(weights_path)
+        if numpy_inference:
+            model = inference.DenseNet.from_model(model)
+    _worker.update(env=env, model=model, window_length=window_length,
+                   max_steps=max_steps)
+
+
+def run_episode(args):
+    """(episode番号, seed) の1episodeを走らせて結果をdictで返す"""
+    episode, seed = args
+    env, model = _worker['env'], _worker['model']
+    window_length = _worker['window_length']
+    seed = episode_seed(seed, episode)
+    np.random.seed(seed)
+    gym.spaces.prng.seed(seed)
+    env.seed(seed)
+
+    observation = env.reset()
+    recent = [np.zeros_like(observation)] * (window_length - 1) + \
+        [observation]
+    episode_return = 0.
+    damage = 0.
+    actions = []
+    done = False
+    while not done and len(actions) < _worker['max_steps']:
+        q_values = model.predict_on_batch(np.array([recent]))
+        action = int(np.argmax(q_values[0]))
+        observation, reward, done, info = env.step(action)
+        recent = recent[1:] + [observation]
+        episode_return += reward
+        damage += info.get('damage', 0)
+        actions.append(action)
+    return {'episode': episode, 'return': episode_return,
+            'length': len(actions), 'damage': damage, 'actions': actions}
+
+
+def evaluate(env_name, env_kwargs, model_factory, weights_path,
+             nb_episodes, workers=1, seed=123, window_length=1,
+             max_steps=10000, numpy_inference=False):
+    """nb_episodes個のepisodeをworkers個のプロセスで走らせ、
+    episode番号順の結果のリストを返す(workers <= 1 ならこのプロセスで)
+
+    numpy_inference ならQ値はinference.DenseNetで計算する.
+    """
+    initargs = (env_name, env_kwargs, model_factory, weights_path,
+                window_length, max_steps, numpy_inference)
+    tasks = [(episode, seed) for episode in range(nb_episodes)]
+    if workers <= 1:
+        init_worker(*initargs)
+        return list(map(run_episode, tasks))
+    context = get_context('spawn')
+    with context.Pool(workers, initializer=init_worker,
+                      initargs=initargs) as pool:
+        return pool.map(run_episode, tasks, chunksize=1)
+
+
+def summarize(results, nb_actions):
+    """結果をAggregateEpisodeLoggerにまとめる(tableで表にできる)"""
+    import logger
+
+    cb_ep = logger.AggregateEpisodeLogger(window=max(len(results), 1))
+    for result in results:
+        cb_ep.add_episode(result['return'], result['length'],
+                          result['damage'],
+                          np.bincount(np.asarray(result['actions'],
+                                                 dtype=np.int64),
+                                      minlength=nb_actions))
+    return cb_ep
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""env.render(mode='frame')の盤面をファイルに録画し、あとで再生する
+
+ファイルは1行目がJSONのヘッダ(盤面の形と記号)で、その後に
+(episode番号 int32, 盤面 uint8[H, W]) の固定長レコードが続く.
+
+    cd src && python frames.py frames_myenv-v0_train.bin
+    cd src && python frames.py frames_myenv-v0_train.bin -ep 3 --fps 0
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+def record_dtype(shape):
+    return np.dtype([('episode', '<i4'), ('frame', np.uint8, tuple(shape))])
+
+
+class FrameRecorder(object):
+    """盤面をbatch_size枚ずつまとめて、別スレッドでファイルに追記する"""
+
+    def __init__(self, path, batch_size=256, max_batches=16):
+        self.path = path
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_batches)
+        self.records = None
+        self.size = 0
+        self.nb_frames = 0
+        self.thread = None
+
+    def _open(self, shape, symbols):
+        self.records = np.empty(self.batch_size, dtype=record_dtype(shape))
+        header = {'shape': list(shape), 'symbols': list(symbols)}
+        self.thread = threading.Thread(
+            target=self._write, args=(json.dumps(header),), daemon=True)
+        self.thread.start()
+
+    def _write(self, header):
+        with open(self.path, 'wb') as f:
+            f.write(header.encode('utf-8') + b'\n')
+            while True:
+                records = self.queue.get()
+                if records is None:
+                    return
+                f.write(records.tobytes())
+
+    def add(self, episode, frame, symbols=()):
+        """1枚足す. symbolsは最初の1枚の時だけ使う(盤面の番号→記号)"""
+        if self.records is None:
+            self._open(np.shape(frame), symbols)
+        self.records[self.size] = (episode, frame)
+        self.size += 1
+        self.nb_frames += 1
+        if self.size == self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self.size:
+            self.queue.put(self.records[:self.size].copy())
+            self.size = 0
+
+    def close(self):
+        """残りを書き出し、書き込みスレッドが終わるのを待つ"""
+        if self.thread is None:
+            return
+        self._flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+
+class FrameReader(object):
+    """FrameRecorderが書いたファイルをmemmapで読む"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            line = f.readline()
+        header = json.loads(line.decode('utf-8'))
+        self.shape = tuple(header['shape'])
+        self.symbols = header['symbols']
+        dtype = record_dtype(self.shape)
+        # 書きかけの最後のレコードは読まない
+        count = (os.path.getsize(path) - len(line)) // dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode='r',
+                                     offset=len(line), shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def episodes(self):
+        """録画されているepisode番号の一覧"""
+        return np.unique(self.records['episode']).tolist()
+
+    def frames(self, episode=None):
+        """(episode番号, 盤面) を順に返す. episodeを指定すればそれだけ"""
+        records = self.records
+        if episode is not None:
+            records = records[records['episode'] == episode]
+        for record in records:
+            yield int(record['episode']), record['frame']
+
+    def text(self, frame):
+        """盤面を_render(mode='human')と同じ文字列にする"""
+        symbols = np.array(self.symbols)
+        return '\n'.join(' '.join(row) for row in symbols[frame])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='replay recorded frames')
+    parser.add_argument('path', help='file written with --render record')
+    parser.add_argument('-ep', '--episode', type=int, default=None,
+                        help='play only this episode')
+    parser.add_argument('--fps', type=float, default=10.,
+                        help='frames per second (0: as fast as possible)')
+    args = parser.parse_args()
+
+    reader = FrameReader(args.path)
+    for episode, frame in reader.frames(args.episode):
+        sys.stdout.write('episode {}\n{}\n\n'.format(
+            episode, reader.text(frame)))
+        sys.stdout.flush()
+        if args.fps > 0:
+            time.sleep(1. / args.fps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""create_modelのような Flatten + Dense だけのkerasモデルの順伝播をnumpyで行う
+
+観測1つ分のQ値を求める時は、計算そのものよりkerasのpredictの呼び出しの方が
+ずっと重いので、重みを連続したnumpy配列に写して行列積で計算する.
+重みはkerasのモデルからsyncで、またはget_weights()と同じ並びのリストから
+set_weightsで写す(学習で重みが変わった後は呼び直す).
+
+    net = DenseNet.from_model(model)
+    # (batch, window_length, ...) -> (batch, nb_actions)
+    q_values = net.predict_on_batch(states)
+
+DenseNet.saveで重みと層の並び(とenvの設定)を1つの .npz に書き出せる.
+loadで読んだFrozenPolicyはnumpyだけで動くので、keras/TensorFlowの無い所でも
+すぐに行動を選べる.
+
+    net.save('policy_myenv-v0.npz', env='myenv-v0', window_length=1)
+    policy = load('policy_myenv-v0.npz')
+    action = policy.reset(env.reset())
+"""
+
+import json
+
+import numpy as np
+
+# saveで書くファイルの形式の版
+FORMAT_VERSION = 1
+
+
+def _relu(x):
+    return np.maximum(x, 0., out=x)
+
+
+def _tanh(x):
+    return np.tanh(x, out=x)
+
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1.
+    return np.reciprocal(x, out=x)
+
+
+# kerasのactivationの名前 -> その場で書き換える関数(linearは何もしない)
+ACTIVATIONS = {
+    'linear': None,
+    'relu': _relu,
+    'tanh': _tanh,
+    'sigmoid': _sigmoid,
+}
+# 重みを持たず、順伝播では形を変えるだけの層
+PASS_LAYERS = ('InputLayer', 'Flatten')
+
+
+class DenseNet(object):
+    """Dense層を順に (kernel, bias, activation) で持つ
+
+    layers は Dense層毎の (activation, use_bias).
+    """
+
+    def __init__(self, layers, dtype='float32'):
+        for activation, _ in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError('unsupported activation: {}'.format(
+                    activation))
+        self.layers = list(layers)
+        self.dtype = np.dtype(dtype)
+        self.kernels = [None] * len(self.layers)
+        self.biases = [None] * len(self.layers)
+        self.activations = [ACTIVATIONS[activation]
+                            for activation, _ in self.layers]
+
+    @classmethod
+    def from_model(cls, model, dtype='float32'):
+        """kerasのモデルの層の並びを読み、重みを写したものを返す"""
+        layers = []
+        for layer in model.layers:
+            name = type(layer).__name__
+            if name in PASS_LAYERS:
+                continue
+            if name != 'Dense':
+                raise ValueError('unsupported layer: {} ({})'.format(
+                    layer.name, name))
+            config = layer.get_config()
+            layers.append((config['activation'],
+                           config.get('use_bias', True)))
+        net = cls(layers, dtype)
+        net.sync(model)
+        return net
+
+    def sync(self, model):
+        """kerasのモデルの今の重みを写す"""
+        self.set_weights(model.get_weights())
+
+    def set_weights(self, weights):
+        """kerasのget_weights()と同じ並び(kernel, bias, kernel, ...)の重みを
+        写す. 形が同じなら今の配列に上書きする"""
+        weights = list(weights)
+        expected = sum(2 if use_bias else 1 for _, use_bias in self.layers)
+        if len(weights) != expected:
+            raise ValueError('expected {} weight arrays, got {}'.format(
+                expected, len(weights)))
+        weights.reverse()
+        for i, (_, use_bias) in enumerate(self.layers):
+            self.kernels[i] = self._copy(self.kernels[i], weights.pop())
+            if use_bias:
+                self.biases[i] = self._copy(self.biases[i], weights.pop())
+
+    def _copy(self, array, value):
+        if array is not None and array.shape == np.shape(value):
+            np.copyto(array, value, casting='unsafe')
+            return array
+        return np.array(value, dtype=self.dtype, order='C')
+
+    def get_weights(self):
+        weights = []
+        for kernel, bias in zip(self.kernels, self.biases):
+            weights.append(kernel.copy())
+            if bias is not None:
+                weights.append(bias.copy())
+        return weights
+
+    @property
+    def input_size(self):
+        return self.kernels[0].shape[0]
+
+    @property
+    def output_size(self):
+        return self.kernels[-1].shape[1]
+
+    def predict_on_batch(self, x):
+        """(batch, ...) の入力を平らにして、(batch, 出力) を返す"""
+        x = np.asarray(x)
+        h = x.reshape(len(x), -1)
+        if h.shape[1] != self.input_size:
+            raise ValueError('expected {} inputs per sample, got {}'.format(
+                self.input_size, h.shape[1]))
+        if h.dtype != self.dtype:
+            h = h.astype(self.dtype)
+        for kernel, bias, activation in zip(self.kernels, self.biases,
+                                            self.activations):
+            h = np.dot(h, kernel)
+            if bias is not None:
+                h += bias
+            if activation is not None:
+                activation(h)
+        return h
+
+    predict = predict_on_batch
+
+    def predict_one(self, x):
+        """入力1つ分の出力(1次元)"""
+        return self.predict_on_batch(np.asarray(x)[None])[0]
+
+    def save(self, path, **meta):
+        """重みと層の並びを .npz に書く. metaはJSONにできるものを一緒に入れる
+        (envの名前, window_length, envの引数など)"""
+        arrays = {}
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            arrays['kernel_{}'.format(i)] = kernel
+            if bias is not None:
+                arrays['bias_{}'.format(i)] = bias
+        header = {'version': FORMAT_VERSION,
+                  'layers': [list(layer) for layer in self.layers],
+                  'dtype': self.dtype.name,
+                  'meta': meta}
+        arrays['header'] = np.array(json.dumps(header))
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """saveで書いたファイルから (DenseNet, meta)"""
+        with np.load(path) as data:
+            header = json.loads(str(data['header']))
+            if header['version'] != FORMAT_VERSION:
+                raise ValueError('unsupported policy file version: {}'
+                                 .format(header['version']))
+            layers = [tuple(layer) for layer in header['layers']]
+            weights = []
+            for i, (_, use_bias) in enumerate(layers):
+                weights.append(data['kernel_{}'.format(i)])
+                if use_bias:
+                    weights.append(data['bias_{}'.format(i)])
+        net = cls(layers, header['dtype'])
+        net.set_weights(weights)
+        return net, header['meta']
+
+
+class FrozenPolicy(object):
+    """DenseNetで直近window_length個の観測からgreedyに行動を選ぶ
+    (DQNAgentのtest_policyと同じ. 足りない所は0の観測で埋める)"""
+
+    def __init__(self, net, window_length=1, meta=None):
+        self.net = net
+        self.window_length = window_length
+        self.meta = meta or {}
+        self.recent = None
+
+    @property
+    def nb_actions(self):
+        return self.net.output_size
+
+    def predict_on_batch(self, states):
+        return self.net.predict_on_batch(states)
+
+    def reset(self, observation):
+        """episodeの最初の観測で窓を作り直し、最初の行動を返す"""
+        observation = np.asarray(observation)
+        self.recent = np.zeros((1, self.window_length) + observation.shape,
+                               dtype=observation.dtype)
+        self.recent[0, -1] = observation
+        return self._greedy()
+
+    def act(self, observation):
+        """観測を窓に足して、Q値が一番大きい行動を返す"""
+        if self.recent is None:
+            return self.reset(observation)
+        self.recent[0, :-1] = self.recent[0, 1:]
+        self.recent[0, -1] = observation
+        return self._greedy()
+
+    def _greedy(self):
+        return int(np.argmax(self.net.predict_on_batch(self.recent)[0]))
+
+
+def load(path):
+    """DenseNet.saveで書いたファイルをFrozenPolicyにする"""
+    net, meta = DenseNet.load(path)
+    return FrozenPolicy(net, meta.get('window_length', 1), meta)
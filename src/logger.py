@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-import rl.callbacks
+import os
+import shutil
+from collections import deque
+import numpy as np
+try:
+    from rl.callbacks import Callback
+except ImportError:
+    # keras無しでもAggregateEpisodeLoggerの集計(add_episode, table)は使える
+    Callback = object
 
 
-class EpisodeLogger(rl.callbacks.Callback):
+class EpisodeLogger(Callback):
     def __init__(self):
         self.observations = {}
         self.rewards = {}
@@ -20,3 +28,221 @@ class EpisodeLogger(rl.callbacks.Callback):
         self.observations[episode].append(logs['observation'])
         self.rewards[episode].append(logs['reward'])
         self.actions[episode].append(logs['action'])
+
+
+class AggregateEpisodeLogger(Callback):
+    """観測は持たずに、episode毎の集計値と直近windowの統計だけを持つ
+
+    1episodeの間は 報酬の合計, 長さ, actionの回数, 受けたダメージ(info['damage'])
+    を足していくだけで、終わったらwindow分のdequeに移す.
+    """
+    PERCENTILES = (5, 50, 95)
+
+    def __init__(self, window=100):
+        self.window = window
+        self.nb_episodes = 0
+        self.returns = deque(maxlen=window)
+        self.lengths = deque(maxlen=window)
+        self.damages = deque(maxlen=window)
+        self.action_counts = deque(maxlen=window)
+        self.episode_return = 0.
+        self.episode_length = 0
+        self.episode_damage = 0.
+        self.episode_actions = None
+
+    def on_episode_begin(self, episode, logs):
+        self.episode_return = 0.
+        self.episode_length = 0
+        self.episode_damage = 0.
+        self.episode_actions = np.zeros(self.env.action_space.n,
+                                        dtype=np.int64)
+
+    def on_step_end(self, step, logs):
+        self.episode_return += logs['reward']
+        self.episode_length += 1
+        self.episode_damage += logs['info'].get('damage', 0)
+        self.episode_actions[logs['action']] += 1
+
+    def on_episode_end(self, episode, logs):
+        self.add_episode(self.episode_return, self.episode_length,
+                         self.episode_damage, self.episode_actions)
+
+    def add_episode(self, episode_return, length, damage, action_counts):
+        """1episode分の集計値を足す(callbackを通さずに集めた結果用)"""
+        self.nb_episodes += 1
+        self.returns.append(episode_return)
+        self.lengths.append(length)
+        self.damages.append(damage)
+        self.action_counts.append(action_counts)
+
+    def summary(self):
+        """直近window分の {指標: {'mean', 'p5', 'p50', 'p95'}} と actionの回数"""
+        stats = {}
+        for name, values in (('return', self.returns),
+                             ('length', self.lengths),
+                             ('damage', self.damages)):
+            values = np.asarray(values, dtype=np.float64)
+            stats[name] = {'mean': values.mean() if len(values) else np.nan}
+            for q in self.PERCENTILES:
+                stats[name]['p{}'.format(q)] = (
+                    np.percentile(values, q) if len(values) else np.nan)
+        if self.action_counts:
+            stats['actions'] = np.sum(self.action_counts, axis=0)
+        else:
+            stats['actions'] = np.zeros(0, dtype=np.int64)
+        return stats
+
+    def table(self):
+        """summaryを表の文字列にする"""
+        stats = self.summary()
+        columns = ['mean'] + ['p{}'.format(q) for q in self.PERCENTILES]
+        lines = ['episodes: {} (last {})'.format(
+                     self.nb_episodes, len(self.returns)),
+                 '{:8s}'.format('') + ''.join(
+                     '{:>10s}'.format(column) for column in columns)]
+        for name in ('return', 'length', 'damage'):
+            lines.append('{:8s}'.format(name) + ''.join(
+                '{:10.2f}'.format(stats[name][column])
+                for column in columns))
+        lines.append('actions: ' + ' '.join(
+            '{}={}'.format(action, count)
+            for action, count in enumerate(stats['actions'])))
+        return '\n'.join(lines)
+
+
+class StreamingEpisodeLogger(Callback):
+    """EpisodeLoggerと同じものを、chunk毎にファイルへ書き出しながら記録する
+
+    <directory>/episode_000000/chunk_0000.npz に observation, reward,
+    action の列を1つずつ入れる. メモリに持つのは書き出す前の1chunk分だけ.
+    前の実行が同じdirectoryに残したepisode_*は始める前に消す
+    (EpisodeReaderが今回のepisodeとつなげて読まないように).
+    """
+
+    def __init__(self, directory, chunk_size=1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.episode = None
+        self.chunk = 0
+        self.size = 0
+        self.observations = None
+        self.rewards = np.empty(chunk_size, dtype=np.float32)
+        self.actions = np.empty(chunk_size, dtype=np.int64)
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.startswith('episode_'):
+                shutil.rmtree(os.path.join(directory, name))
+
+    def on_episode_begin(self, episode, logs):
+        self.episode = episode
+        self.chunk = 0
+        self.size = 0
+        episode_dir = self._episode_dir(episode)
+        if os.path.exists(episode_dir):
+            shutil.rmtree(episode_dir)
+        os.makedirs(episode_dir)
+
+    def on_step_end(self, step, logs):
+        observation = np.asarray(logs['observation'])
+        if self.observations is None or \
+           self.observations.shape[1:] != observation.shape:
+            self.observations = np.empty(
+                (self.chunk_size,) + observation.shape,
+                dtype=observation.dtype)
+        self.observations[self.size] = observation
+        self.rewards[self.size] = logs['reward']
+        self.actions[self.size] = logs['action']
+        self.size += 1
+        if self.size == self.chunk_size:
+            self._flush()
+
+    def on_episode_end(self, episode, logs):
+        if self.size > 0:
+            self._flush()
+
+    def _flush(self):
+        path = os.path.join(self._episode_dir(self.episode),
+                            'chunk_{:04d}.npz'.format(self.chunk))
+        np.savez(path,
+                 observation=self.observations[:self.size],
+                 reward=self.rewards[:self.size],
+                 action=self.actions[:self.size])
+        self.chunk += 1
+        self.size = 0
+
+    def _episode_dir(self, episode):
+        return os.path.join(self.directory, 'episode_{:06d}'.format(episode))
+
+
+class EpisodeReader(object):
+    """StreamingEpisodeLoggerが書いたepisodeを1つずつ読む"""
+    FIELDS = ('observation', 'reward', 'action')
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def episodes(self):
+        """記録されているepisode番号の一覧"""
+        return sorted(int(name.split('_')[1])
+                      for name in os.listdir(self.directory)
+                      if name.startswith('episode_'))
+
+    def chunks(self, episode):
+        """1episodeのchunkを先頭から順に {列名: 配列} で返す"""
+        episode_dir = os.path.join(self.directory,
+                                   'episode_{:06d}'.format(episode))
+        for name in sorted(os.listdir(episode_dir)):
+            with np.load(os.path.join(episode_dir, name)) as chunk:
+                yield {field: chunk[field] for field in self.FIELDS}
+
+    def read(self, episode):
+        """1episode分をつなげて {列名: 配列} で返す"""
+        chunks = list(self.chunks(episode))
+        if not chunks:
+            return {field: np.empty(0) for field in self.FIELDS}
+        return {field: np.concatenate([chunk[field] for chunk in chunks])
+                for field in self.FIELDS}
+
+    def __iter__(self):
+        for episode in self.episodes():
+            yield episode, self.read(episode)
+
+
+class RenderPolicy(Callback):
+    """visualize=Trueの代わりに、描画する頻度を選ぶ
+
+    off    : 描画しない
+    step   : every stepに1回描画する
+    episode: every episodeに1回、そのepisodeの全stepを描画する
+    record : every stepに1回、render(mode='frame')の盤面をrecorderに渡す
+    """
+    MODES = ('off', 'step', 'episode', 'record')
+
+    def __init__(self, mode='step', every=1, recorder=None):
+        if mode not in self.MODES:
+            raise ValueError('Not supported such render mode: {}'
+                             .format(mode))
+        if mode == 'record' and recorder is None:
+            raise ValueError('record mode needs a recorder')
+        self.mode = mode
+        self.every = every
+        self.recorder = recorder
+        self.episode = 0
+        self.step = 0
+
+    def on_episode_begin(self, episode, logs):
+        self.episode = episode
+
+    def on_action_end(self, action, logs):
+        self.step += 1
+        if self.mode == 'step' and self.step % self.every == 0:
+            self.env.render(mode='human')
+        elif self.mode == 'episode' and self.episode % self.every == 0:
+            self.env.render(mode='human')
+        elif self.mode == 'record' and self.step % self.every == 0:
+            self.recorder.add(self.episode, self.env.render(mode='frame'),
+                              self.env.unwrapped.FIELD_TYPES)
+
+    def on_train_end(self, logs):
+        if self.recorder is not None:
+            self.recorder.close()
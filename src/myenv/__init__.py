@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-from gym.envs.registration import register
-
-
-register(
-    id='myenv-v0',
-    entry_point='myenv.sampleEnv:MyEnv'
-    )
-register(
-    id='myenv-v1',
-    entry_point='myenv.env:MyEnv'
-    )
-register(
-    id='myenv-v2',
-    entry_point='myenv.envAd:MyEnv'
-    )
+# gymに登録するenv. import myenv の時に登録する(import myenv; gym.make
+# の順でも使えるように). myenv_dqnはmyenvを使う所で読み込むので--helpは速い
+ENVS = {
+    'myenv-v0': 'myenv.sampleEnv:MyEnv',
+    'myenv-v1': 'myenv.env:MyEnv',
+    'myenv-v2': 'myenv.envAd:MyEnv',
+    # mapgenで作る大きいMAP(既定64x64)と勇者の周りだけの観測
+    'myenv-v3': 'myenv.largeEnv:MyEnv',
+}
+
+
+def register():
+    """ENVSをgymに登録する(何度呼んでもよい)"""
+    from gym.envs.registration import register, registry
+
+    for env_id, entry_point in ENVS.items():
+        if env_id not in registry.env_specs:
+            register(id=env_id, entry_point=entry_point)
+
+
+def make(env_id, **kwargs):
+    """gym.makeと同じだが、envのコンストラクタに引数(obs_dtype等)を渡せる"""
+    import gym
+
+    register()
+    spec = gym.spec(env_id)
+    default_kwargs = spec._kwargs
+    spec._kwargs = dict(default_kwargs, **kwargs)
+    try:
+        return gym.make(env_id)
+    finally:
+        spec._kwargs = default_kwargs
+
+
+register()
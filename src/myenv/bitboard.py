@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+SIZE = 5
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+
+
+def line_masks(size=SIZE, diagonals=False):
+    """縦横(と斜め)の勝ちラインをbitマスクのリストで返す"""
+    masks = []
+    for row in range(size):
+        masks.append(sum(1 << (row * size + col) for col in range(size)))
+    for col in range(size):
+        masks.append(sum(1 << (row * size + col) for row in range(size)))
+    if diagonals:
+        masks.append(sum(1 << (i * size + i) for i in range(size)))
+        masks.append(sum(1 << (i * size + size - 1 - i)
+                         for i in range(size)))
+    return masks
+
+
+def dihedral(array, k, axes=(0, 1)):
+    """正方形の盤の8つの対称変換のk番目(0..3: 90度ずつ回転, 4..7: その後に
+    左右反転)をaxesの2軸に掛ける"""
+    array = np.rot90(array, k % 4, axes)
+    if k >= 4:
+        array = np.flip(array, axes[1])
+    return array
+
+
+def cell_of(coord, size=SIZE):
+    """MAPの座標をbit番号に変換する(負の添字はnumpyと同じく後ろから)"""
+    return (coord[0] % size) * size + coord[1] % size
+
+
+class BitBoard(object):
+    """盤面を手番ごとの25bit整数2つで持つ"""
+
+    def __init__(self, diagonals=False, size=SIZE):
+        self.size = size
+        self.full = (1 << (size * size)) - 1
+        self.masks = line_masks(size, diagonals)
+        # そのマスを通るラインだけを持っておき、勝ち判定を定数回で済ませる
+        self.cell_masks = [
+            tuple(mask for mask in self.masks if mask >> cell & 1)
+            for cell in range(size * size)
+            ]
+        self.reset()
+
+    def reset(self):
+        self.boards = [0, 0]
+        self.last = None
+
+    def place(self, player, cell):
+        """石を置き、既に石があった(miss)かを返す"""
+        bit = 1 << cell
+        is_miss = bool((self.boards[0] | self.boards[1]) & bit)
+        # missの時はMAPと同じく上書きする
+        self.boards[1 - player] &= ~bit
+        self.boards[player] |= bit
+        self.last = cell
+        return is_miss
+
+    def is_win(self, player, cell=None):
+        """playerが1ライン揃えたか. cellを渡すとそのマスを通るラインだけ見る"""
+        board = self.boards[player]
+        masks = self.masks if cell is None else self.cell_masks[cell]
+        for mask in masks:
+            if board & mask == mask:
+                return True
+        return False
+
+    def is_full(self):
+        return (self.boards[0] | self.boards[1]) == self.full
+
+    def to_array(self, empty=2):
+        """MAPと同じ形(0: 先手, 1: 後手, empty: 空き)の配列にする"""
+        cells = np.arange(self.size * self.size)
+        board = np.full(self.size * self.size, empty, dtype=np.int64)
+        board[(self.boards[0] >> cells) & 1 == 1] = 0
+        board[(self.boards[1] >> cells) & 1 == 1] = 1
+        return board.reshape(self.size, self.size)
+
+
+class Symmetry(object):
+    """盤の8つの対称変換をbitboardに掛け、同じ形の盤を1つの代表(canonical)に
+    まとめる
+
+    permutations[k][i]: 変換kの後のマスiに来る、元のマスの番号.
+    bitboardは5行に分けて、行ごとの表を引いてORするだけで変換する.
+    """
+    NB_TRANSFORMS = 8
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        cells = np.arange(size * size).reshape(size, size)
+        self.permutations = np.array([
+            dihedral(cells, k).ravel() for k in range(self.NB_TRANSFORMS)])
+        # inverses[k][c]: 元のマスcが変換kの後に来るマス
+        self.inverses = np.argsort(self.permutations, axis=1)
+        # tables[k][row][bits]: 元の盤のrow行目がbits(size bit)の時の変換後
+        self.tables = [[[self._map_bits(k, row, bits)
+                         for bits in range(1 << size)]
+                        for row in range(size)]
+                       for k in range(self.NB_TRANSFORMS)]
+        self.row_mask = (1 << size) - 1
+
+    def _map_bits(self, k, row, bits):
+        result = 0
+        for col in range(self.size):
+            if bits >> col & 1:
+                result |= 1 << int(self.inverses[k][row * self.size + col])
+        return result
+
+    def transform(self, board, k):
+        """1つのbitboardに変換kを掛ける"""
+        table = self.tables[k]
+        result = 0
+        for row in range(self.size):
+            result |= table[row][board >> (row * self.size) & self.row_mask]
+        return result
+
+    def canonical(self, boards):
+        """(盤の組, k): 8通りに変換した盤の組のうち一番小さいものと、
+        そこへの変換k"""
+        best, best_k = None, 0
+        for k in range(self.NB_TRANSFORMS):
+            candidate = tuple(self.transform(board, k) for board in boards)
+            if best is None or candidate < best:
+                best, best_k = candidate, k
+        return best, best_k
+
+    def cell(self, cell, k):
+        """元のマスcellが変換kの後に来るマス"""
+        return int(self.inverses[k][cell])
+
+    def source_cell(self, cell, k):
+        """変換kの後のマスcellに来る、元のマス"""
+        return int(self.permutations[k][cell])
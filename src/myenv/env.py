@@ -3,14 +3,19 @@
 
 import sys
 import gym
+from io import StringIO
 import numpy as np
 import gym.spaces
 
+from myenv import terrain
+from myenv.observation import ObservationBuffer
+
 
 class MyEnv(gym.Env):
     # human: 画面表示のため.戻り値なし
     # ansi: 文字列 or StringIOを返す
-    metadata = {'render.modes': ['human', 'ansi']}
+    # frame: FIELD_TYPESの番号を入れたuint8の配列を返す(録画用)
+    metadata = {'render.modes': ['human', 'ansi', 'frame']}
     FIELD_TYPES = [
         'S',  # 0: Start
         'G',  # 1: Goal
@@ -32,71 +37,133 @@ class MyEnv(gym.Env):
     ])
     MAX_STEPS = 100
     MAX_DAMAGE = 100
-
-    def __init__(self):
-        """action空間と観測空間、報酬のmin,maxのリスト"""
+    # 地形ごとの (Damageを受ける確率, 受けた時のDamage, 受けなかった時のDamage)
+    DAMAGES = {
+        '~': (1/10., 10, 0),
+        'w': (1/2., 10, 0),
+        '=': (1., 1, 1),
+    }
+    MONSTER_BLOCKED = ('A', 'G')
+    # 敵とぶつかった時のダメージ(MAX_DAMAGEを超えるのでそこで終わる)
+    COLLISION_DAMAGE = MAX_DAMAGE + 1
+    # goal  : 全ての敵がGoalから出てくる
+    # random: 敵が歩けるマス(Startを除く)にばらばらに置く
+    SPAWNS = ('goal', 'random')
+
+    def __init__(self, nb_monsters=1, spawn='goal', obs_mode='buffer',
+                 obs_dtype='uint8', obs_encoding='index'):
+        """action空間と観測空間、報酬のmin,maxのリスト
+
+        敵はnb_monsters体で、位置は (nb_monsters, 2) の配列mon_posに持つ.
+        """
         super().__init__()
+        if spawn not in self.SPAWNS:
+            raise ValueError('Not supported such spawn: {}'.format(spawn))
+        self.nb_monsters = nb_monsters
+        self.spawn = spawn
+        self.observer = ObservationBuffer(
+            self.MAP, len(self.FIELD_TYPES), obs_mode, obs_dtype,
+            obs_encoding, overlays=[self.FIELD_TYPES.index('Y'),
+                                    self.FIELD_TYPES.index('M')])
         self.action_space = gym.spaces.Discrete(4)
-        self.observation_space = gym.spaces.Box(
-            low=0,
-            high=len(self.FIELD_TYPES),
-            shape=self.MAP.shape
-            )
+        self.observation_space = self.observer.space()
         self.reward_range = [-1., 100.]
         self._reset()
 
     def _reset(self):
         """状態を初期化し、初期の観測値を返す"""
+        self.terrain = terrain.get_terrain(
+            self.MAP, self.FIELD_TYPES, self.DAMAGES)
+        self.neighbors = self.terrain.neighbors()
+        self.mon_neighbors = self.terrain.neighbors(self.MONSTER_BLOCKED)
         self.pos = self._find_pos('S')[0]
         self.goal = self._find_pos('G')[0]
-        self.mon_pos = self._find_pos('G')[0]
+        self.mon_cells = self._spawn_monsters()
+        self.mon_pos = np.stack(np.divmod(self.mon_cells, self.MAP.shape[1]),
+                                axis=-1)
         self.done = False
         self.damage = 0
         self.steps = 0
+        self.observer.reset(self.MAP)
+        self.observer.set(self.pos, self.FIELD_TYPES.index('Y'))
+        self.observer.set_many(self.mon_pos, self.FIELD_TYPES.index('M'))
 
         return self._observe()
 
+    def _spawn_monsters(self):
+        """敵の最初のセル番号 (nb_monsters,)"""
+        if self.spawn == 'goal':
+            return np.full(self.nb_monsters, self.terrain.cell(self.goal),
+                           dtype=np.int64)
+        cells = np.flatnonzero(self.terrain.walkable(self.MONSTER_BLOCKED))
+        cells = cells[cells != self.terrain.cell(self.pos)]
+        return gym.spaces.prng.np_random.choice(cells, self.nb_monsters)
+
+    def _move_monsters(self):
+        """全ての敵を1stepまとめて動かし、動いた敵のマスクを返す
+        (山とGoalには入らない. 敵同士は重なってよい)"""
+        actions = gym.spaces.prng.np_random.randint(
+            self.action_space.n, size=self.nb_monsters)
+        next_cells = self.mon_neighbors[self.mon_cells, actions]
+        moved = next_cells != self.mon_cells
+        self.mon_cells = next_cells.astype(np.int64)
+        return moved
+
+    def _collided(self, old_cell, old_mon_cells):
+        """勇者が敵と同じマスにいるか、敵とすれ違ったか(Goalの上は安全)"""
+        cell = self.terrain.cell(self.pos)
+        if (self.pos == self.goal).all():
+            return False
+        return bool(np.any((self.mon_cells == cell) |
+                           ((self.mon_cells == old_cell) &
+                            (old_mon_cells == cell))))
+
     def _next_move(self, pos, action, mon=False):
-        # 1stepの処理
-        if action == 0:
-            next_pos = pos + [0, 1]
-        elif action == 1:
-            next_pos = pos + [0, -1]
-        elif action == 2:
-            next_pos = pos + [1, 0]
-        elif action == 3:
-            next_pos = pos + [-1, 0]
-
-        if self._is_movable(next_pos, mon=mon):
-            moved = True
-        else:
-            moved = False
+        # 1stepの処理. 移動先は参照表から引く
+        neighbors = self.mon_neighbors if mon else self.neighbors
+        cell = self.terrain.cell(pos)
+        next_cell = neighbors[cell, action]
+        moved = next_cell != cell
 
-        return next_pos, moved
+        return self.terrain.pos(next_cell), moved
 
     def _step(self, action):
         """actionを実行し、結果を返す"""
+        old_pos, old_mon_pos = self.pos, self.mon_pos
+        old_cell, old_mon_cells = self.terrain.cell(self.pos), self.mon_cells
         pos, moved = self._next_move(self.pos, action)
-        self.pos = pos if moved is True else self.pos
+        self.pos = pos if moved else self.pos
 
-        mon_action = self.action_space.sample()
-        mon_pos, mon_moved = self._next_move(self.mon_pos, mon_action,
-                                             mon=True)
-        self.mon_pos = mon_pos if mon_moved is True else self.mon_pos
+        mon_moved = self._move_monsters()
+        if mon_moved.any():
+            self.mon_pos = np.stack(
+                np.divmod(self.mon_cells, self.MAP.shape[1]), axis=-1)
+
+        if moved or mon_moved.any():
+            self.observer.restore(old_pos)
+            self.observer.restore_many(old_mon_pos[mon_moved])
+            self.observer.set(self.pos, self.FIELD_TYPES.index('Y'))
+            self.observer.set_many(self.mon_pos, self.FIELD_TYPES.index('M'))
 
         observation = self._observe()
         reward = self._get_reward(self.pos, moved)
-        self.damage += self._get_damage(self.pos)
+        if self._collided(old_cell, old_mon_cells):
+            damage = self.COLLISION_DAMAGE
+        else:
+            damage = self._get_damage(self.pos)
+        self.damage += damage
         self.done = self._is_done()
 
-        return observation, reward, self.done, {}
+        return observation, reward, self.done, {'damage': damage}
 
     def _render(self, mode='human', close=False):
         """環境を可視化する"""
+        if mode == 'frame':
+            return self.observer.index().astype(np.uint8)
         outfile = StringIO() if mode == 'ansi' else sys.stdout
         outfile.write('\n'.join(' '.join(
                     self.FIELD_TYPES[elem] for elem in row
-                    ) for row in self._observe()
+                    ) for row in self.observer.index()
                 ) + '\n\n'
             )
 
@@ -117,41 +184,21 @@ class MyEnv(gym.Env):
 
     def _get_damage(self, pos):
         """ダメージ計算"""
-        field_type = self.FIELD_TYPES[self.MAP[tuple(pos)]]
-        if field_type == 'S' or 'G':
-            return 0
-        elif field_type == '~':
-            return 10 if np.random.random() < 1/10. else 0
-        elif field_type == 'w':
-            return 10 if np.random.random() < 1/2. else 0
-        elif field_type == '=':
-            return 1
-        elif field_type == 'M':
-            return self.MAX_DAMAGE + 1
+        return self.terrain.damage(self.terrain.cell(pos))
 
     def _is_movable(self, pos, mon=False):
         """移動できるかの確認"""
-        if mon is False:
-            return (
-                0 <= pos[0] < self.MAP.shape[0]
-                and 0 <= pos[1] < self.MAP.shape[1]
-                and self.FIELD_TYPES[self.MAP[tuple(pos)]] != 'A'
-            )
-        else:
-            return (
-                0 <= pos[0] < self.MAP.shape[0]
-                and 0 <= pos[1] < self.MAP.shape[1]
-                and self.FIELD_TYPES[self.MAP[tuple(pos)]] != 'A'
-                and self.FIELD_TYPES[self.MAP[tuple(pos)]] != 'G'
-            )
+        walkable = self.terrain.walkable(
+            self.MONSTER_BLOCKED if mon else ('A',))
+        return (
+            0 <= pos[0] < self.MAP.shape[0]
+            and 0 <= pos[1] < self.MAP.shape[1]
+            and walkable[self.terrain.cell(pos)]
+        )
 
     def _observe(self):
-        """マップに勇者の位置を重ねて返す"""
-        observation = self.MAP.copy()
-        observation[tuple(self.pos)] = self.FIELD_TYPES.index('Y')
-        observation[tuple(self.mon_pos)] = self.FIELD_TYPES.index('M')
-
-        return observation
+        """マップに勇者と敵の位置を重ねて返す(重ねる処理はstep毎に差分だけ)"""
+        return self.observer.get()
 
     def _is_done(self):
         if (self.pos == self.goal).all():
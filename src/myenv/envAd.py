@@ -3,9 +3,13 @@
 
 import sys
 import gym
+from io import StringIO
 import numpy as np
 import gym.spaces
-from time import sleep
+
+from myenv.bitboard import BitBoard, Symmetry, cell_of, dihedral
+from myenv.observation import ObservationBuffer
+from myenv.search import AlphaBeta
 
 
 class Player():
@@ -14,16 +18,12 @@ class Player():
         self.action_count = 0
         self.is_later = is_later
 
-    def is_threshold_exceeded(self, limit_num):
-        if self.action_count >= limit_num:
-            return True
-        return False
-
 
 class MyEnv(gym.Env):
     # human: 画面表示のため.戻り値なし
     # ansi: 文字列 or StringIOを返す
-    metadata = {'render.modes': ['human', 'ansi']}
+    # frame: FIELD_TYPESの番号を入れたuint8の配列を返す(録画用)
+    metadata = {'render.modes': ['human', 'ansi', 'frame']}
     FIELD_TYPES = [
         '○',
         '×',
@@ -43,40 +43,45 @@ class MyEnv(gym.Env):
         [2, 2, 2, 2, 2],
         [2, 2, 2, 2, 2],
     ])
-    WIN_MAP = np.array([
-        [[0, 0], [0, 1], [0, 2], [0, 3], [0, 4]],
-        [[1, 0], [1, 1], [1, 2], [1, 3], [1, 4]],
-        [[2, 0], [2, 1], [2, 2], [2, 3], [2, 4]],
-        [[3, 0], [3, 1], [3, 2], [3, 3], [3, 4]],
-        [[4, 0], [4, 1], [4, 2], [4, 3], [4, 4]],
-        [[0, 0], [1, 0], [2, 0], [3, 0], [4, 0]],
-        [[0, 1], [1, 1], [2, 1], [3, 1], [4, 1]],
-        [[0, 2], [1, 2], [2, 2], [3, 2], [4, 2]],
-        [[0, 3], [1, 3], [2, 3], [3, 3], [4, 3]],
-        [[0, 4], [1, 4], [2, 4], [3, 4], [4, 4]]
-    ])
-    PREEMPTION_MAX_STEPS = 13
-    LATE_MAX_STEPS = 12
+    # alphabeta: 後手をsearch.AlphaBetaが打ち、agentは先手だけを打つ
+    OPPONENTS = (None, 'alphabeta')
+
+    def __init__(self, diagonals=False, opponent=None, opponent_depth=2,
+                 table_size=100000, obs_mode='buffer', obs_dtype='uint8',
+                 obs_encoding='index'):
+        """action空間と観測空間、報酬のmin,maxのリスト
 
-    def __init__(self):
-        """action空間と観測空間、報酬のmin,maxのリスト"""
+        opponentを指定すると、1stepでagentの手(先手)と相手の手(後手)を
+        続けて打つ. table_sizeは相手の置換表の上限.
+        """
         super().__init__()
+        if opponent not in self.OPPONENTS:
+            raise ValueError('Not supported such opponent: {}'.format(
+                opponent))
+        self.board = BitBoard(diagonals=diagonals)
+        self.opponent = None
+        if opponent == 'alphabeta':
+            self.opponent = AlphaBeta(self.board, opponent_depth,
+                                      table_size)
+        self.observer = ObservationBuffer(
+            self.INIT_MAP, len(self.FIELD_TYPES), obs_mode, obs_dtype,
+            obs_encoding)
         self.action_space = gym.spaces.Discrete(25)
-        self.observation_space = gym.spaces.Box(
-            low=0,
-            high=len(self.FIELD_TYPES),
-            shape=self.MAP.shape
-            )
-        self.MAP = self.INIT_MAP.copy()
+        self.observation_space = self.observer.space()
         self.reward_range = [-2., 100.]
         self._reset()
 
     def _reset(self):
         print('reset')
-        self.MAP = self.INIT_MAP.copy()
         print(self.MAP)
         print(self.INIT_MAP)
         """状態を初期化し、初期の観測値を返す"""
+        self.board.reset()
+        self.observer.reset()
+        if self.opponent is not None:
+            # 前のepisodeの置換表が残ると、同じ局面でも相手の手が変わる
+            # (同じseedで同じgameにならない)ので毎回空にする
+            self.opponent.table.clear()
         self.preemption_player = Player(False)
         self.late_player = Player(True)
         self.done = False
@@ -108,14 +113,44 @@ class MyEnv(gym.Env):
         reward = self._get_reward(is_late, observation, is_miss)
         self.steps += 1
         self.done = self._is_done()
+        if self.opponent is not None and not self.done:
+            observation, reward = self._opponent_step()
         return observation, reward, self.done, {}
 
+    def _opponent_step(self):
+        """後手の手をopponentに選ばせて打つ. (観測, 先手から見た報酬)"""
+        cell = self.opponent.move(self.board.boards[1], self.board.boards[0])
+        is_miss = self._set_coord(divmod(cell, self.board.size), True)
+        self.late_player.action_count += 1
+        observation = self._observe()
+        reward = self._get_reward(True, observation, is_miss)
+        self.steps += 1
+        self.done = self._is_done()
+        return observation, reward
+
+    def symmetry_transforms(self):
+        """盤の8つの対称変換を (観測, action) -> (観測, action) の関数の
+        リストにする(replay.SymmetryAugmentedMemory用. 0番目は恒等変換)"""
+        symmetry = Symmetry(self.board.size)
+        cells = self.board.size * self.board.size
+
+        def transform(k):
+            def apply(observation, action):
+                # actionのマスは (action // 5 - 1, action % 5) = action - 5
+                cell = symmetry.cell((action - self.board.size) % cells, k)
+                return (dihedral(observation, k),
+                        (cell + self.board.size) % cells)
+            return apply
+        return [transform(k) for k in range(Symmetry.NB_TRANSFORMS)]
+
     def _render(self, mode='human', close=False):
         """環境を可視化する"""
+        if mode == 'frame':
+            return self.observer.index().astype(np.uint8)
         outfile = StringIO() if mode == 'ansi' else sys.stdout
         outfile.write('\n'.join(' '.join(
                 self.FIELD_TYPES[elem] for elem in row
-                ) for row in self._observe()
+                ) for row in self.observer.index()
             ) + '\n\n'
         )
         return outfile
@@ -128,18 +163,12 @@ class MyEnv(gym.Env):
 
     def _get_reward(self, is_late, observation, is_miss):
         """報酬の計算"""
-        # マップから勝敗の確認
+        # 最後に置いたマスを通るラインだけで勝敗の確認
         if is_late:
-            pos = self._find_pos('×')
-            print(pos)
-            print(np.all(self.WIN_MAP == pos))
-            if np.all(pos == self.WIN_MAP):
-                sleep(2)
+            if self.board.is_win(1, self.board.last):
                 self.late_player.is_win = True
         else:
-            pos = self._find_pos('○')
-            if np.all(pos == self.WIN_MAP):
-                sleep(2)
+            if self.board.is_win(0, self.board.last):
                 self.preemption_player.is_win = True
 
         # 報酬計算
@@ -162,34 +191,22 @@ class MyEnv(gym.Env):
         return False
 
     def _is_draw(self):
-        if self.preemption_player.is_threshold_exceeded(
-            self.PREEMPTION_MAX_STEPS) and \
-           self.late_player.is_threshold_exceeded(self.LATE_MAX_STEPS):
-            return True
-        return False
+        # missすると相手の勝ちで終わるので、手数の上限 = 盤面が埋まった時
+        return self.board.is_full()
 
     def _observe(self):
-        """マップに勇者の位置を重ねて返す"""
-        observation = self.MAP.copy()
-        return observation
+        """盤面を返す(置いたマスだけstep毎に書き換えてある)"""
+        return self.observer.get()
 
     def _set_coord(self, coord, is_late):
-        is_miss = False
         if is_late:
-            if self.FIELD_TYPES[self.MAP[tuple(coord)]] != '-':
+            is_miss = self.board.place(1, cell_of(coord))
+            if is_miss:
                 self.preemption_player.is_win = True
-                print('miss')
-                is_miss = True
-            self.MAP[tuple(coord)] = self.FIELD_TYPES.index('×')
+            self.observer.set(coord, self.FIELD_TYPES.index('×'))
         else:
-            if self.FIELD_TYPES[self.MAP[tuple(coord)]] != '-':
+            is_miss = self.board.place(0, cell_of(coord))
+            if is_miss:
                 self.late_player.is_win = True
-                print('miss')
-                is_miss = True
-            self.MAP[tuple(coord)] = self.FIELD_TYPES.index('○')
+            self.observer.set(coord, self.FIELD_TYPES.index('○'))
         return is_miss
-
-    def _find_pos(self, field_type):
-        return np.array(list(zip(*np.where(
-            self.MAP == self.FIELD_TYPES.index(field_type)
-            ))))
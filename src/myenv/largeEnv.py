@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from myenv import mapgen, sampleEnv
+
+
+class MyEnv(sampleEnv.MyEnv):
+    """mapgenでseedから作った大きいMAPを歩くsampleEnv.MyEnv
+
+    地形, 報酬, ダメージはsampleEnvと同じ. 観測は既定で勇者の周り
+    (2*obs_window+1)四方だけなので、MAPを大きくしてもstepの手間と
+    ネットワークの入力の大きさは変わらない(obs_window=NoneでMAP全体).
+    episodeはmax_steps(既定は 4*(height+width))stepで打ち切る.
+    """
+
+    def __init__(self, height=64, width=64, map_seed=0, max_steps=None,
+                 obs_mode='buffer', obs_dtype='uint8', obs_encoding='index',
+                 obs_window=5):
+        self.MAP = mapgen.generate(height, width, map_seed,
+                                   self.FIELD_TYPES)
+        self.MAX_STEPS = max_steps or 4 * (height + width)
+        # S, Gの位置はresetの度にMAP全体を探さずに覚えておく
+        self._positions = {}
+        super().__init__(obs_mode, obs_dtype, obs_encoding, obs_window)
+
+    def _step(self, action):
+        self.steps += 1
+        return super()._step(action)
+
+    def _find_pos(self, field_type):
+        if field_type not in self._positions:
+            self._positions[field_type] = super()._find_pos(field_type)
+        return np.array(self._positions[field_type])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""seedから大きいMAPを作る(sampleEnv.MyEnvと同じ地形の種類)
+
+標高と湿り気の2つの滑らかな乱数の場(value noiseを数オクターブ重ねたもの)を
+作り、割合で切って地形にする:
+    標高の高い方 mountain  : 山(歩けない)
+    標高の低い方 swamp     : 毒沼
+    湿り気の多い方 forest  : 森
+    残り                   : 芝生
+Startは左上1/4, Goalは右下1/4に置き、その間を右か下にだけ進む乱歩で
+山を芝生に掘るので、必ずGoalまで歩ける. 計算はすべて配列でO(H*W).
+
+    cd src && python -m myenv.mapgen 32 48 --seed 1
+"""
+
+import argparse
+
+import numpy as np
+
+# sampleEnv.MyEnv.FIELD_TYPES と同じ並び
+FIELD_TYPES = ['S', 'G', '~', 'w', '=', 'A', 'Y']
+
+
+def value_noise(shape, scale, random):
+    """間隔scaleの格子に置いた一様乱数を滑らかに補間した (H, W) の場(0..1)"""
+    height, width = shape
+    grid = random.random_sample((height // scale + 2, width // scale + 2))
+    y = np.arange(height) / scale
+    x = np.arange(width) / scale
+    y0 = y.astype(np.int64)
+    x0 = x.astype(np.int64)
+    fy = (y - y0)[:, None]
+    fx = (x - x0)[None, :]
+    # smoothstepで格子の境目を目立たなくする
+    fy = fy * fy * (3. - 2. * fy)
+    fx = fx * fx * (3. - 2. * fx)
+    top = grid[y0][:, x0] * (1. - fx) + grid[y0][:, x0 + 1] * fx
+    bottom = grid[y0 + 1][:, x0] * (1. - fx) + grid[y0 + 1][:, x0 + 1] * fx
+    return top * (1. - fy) + bottom * fy
+
+
+def fractal_noise(shape, scale, random, octaves=3):
+    """間隔を半分、重みを半分にしながらvalue_noiseを重ねる"""
+    total = np.zeros(shape)
+    weights = .5 ** np.arange(octaves)
+    for weight in weights:
+        total += weight * value_noise(shape, max(scale, 1), random)
+        scale //= 2
+    return total / weights.sum()
+
+
+def carve_path(field, start, goal, random, value, blocked):
+    """startからgoalまで右か下に進む乱歩の上のblockedをvalueにする"""
+    down, right = goal[0] - start[0], goal[1] - start[1]
+    moves = random.permutation(np.r_[np.ones(down, dtype=bool),
+                                     np.zeros(right, dtype=bool)])
+    rows = start[0] + np.r_[0, np.cumsum(moves)]
+    cols = start[1] + np.r_[0, np.cumsum(~moves)]
+    path = field[rows, cols]
+    field[rows, cols] = np.where(path == blocked, value, path)
+
+
+def generate(height, width, seed=0, field_types=FIELD_TYPES,
+             mountain=.15, forest=.25, swamp=.05, scale=None):
+    """(height, width) のMAP(field_typesの番号)を返す. 同じ引数なら同じMAP"""
+    if height < 2 or width < 2:
+        raise ValueError('map must be at least 2x2: {}x{}'.format(
+            height, width))
+    random = np.random.RandomState(seed)
+    shape = (height, width)
+    if scale is None:
+        scale = max(4, min(shape) // 8)
+    elevation = fractal_noise(shape, scale, random)
+    moisture = fractal_noise(shape, scale, random)
+
+    index = field_types.index
+    field = np.full(shape, index('~'), dtype=np.int64)
+    field[moisture >= np.quantile(moisture, 1. - forest)] = index('w')
+    field[elevation <= np.quantile(elevation, swamp)] = index('=')
+    field[elevation >= np.quantile(elevation, 1. - mountain)] = index('A')
+
+    rows, cols = max(height // 4, 1), max(width // 4, 1)
+    start = (random.randint(rows), random.randint(cols))
+    goal = (height - 1 - random.randint(rows),
+            width - 1 - random.randint(cols))
+    carve_path(field, start, goal, random, index('~'), index('A'))
+    field[start] = index('S')
+    field[goal] = index('G')
+    return field
+
+
+def main():
+    parser = argparse.ArgumentParser(description='print a generated map')
+    parser.add_argument('height', type=int)
+    parser.add_argument('width', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    field = generate(args.height, args.width, args.seed)
+    symbols = np.array(FIELD_TYPES)
+    print('\n'.join(' '.join(row) for row in symbols[field]))
+
+
+if __name__ == '__main__':
+    main()
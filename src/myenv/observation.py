@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+# buffer: 書き換えた配列のコピーを返す(受け取った側が保持してよい)
+# view  : 読み取り専用のviewを返す(次のstepで中身が変わる. 自分でコピーする側向け)
+MODES = ('buffer', 'view')
+# index : MAPと同じ(H, W)にFIELD_TYPESの番号を入れる
+# planes: (H, W, len(FIELD_TYPES))のone-hot. 勇者/敵は地形を消さずに別の面に立てる
+ENCODINGS = ('index', 'planes')
+
+
+class ObservationBuffer(object):
+    """MAPを下地にした観測用の配列を1つだけ持ち、変わったマスだけ書き換える
+
+    windowを指定すると、観測はMAP全体ではなくfocus(勇者)を中心にした
+    (2*window+1)四方だけになる. MAPの外はoutsideの地形で埋めて見せる.
+    観測の大きさもstep毎のコピーもMAPの大きさによらない.
+    """
+
+    def __init__(self, base, nb_types, mode='buffer', dtype='uint8',
+                 encoding='index', overlays=(), window=None, focus=None,
+                 outside=0):
+        if mode not in MODES:
+            raise ValueError('Not supported such observation mode: {}'
+                             .format(mode))
+        if encoding not in ENCODINGS:
+            raise ValueError('Not supported such observation encoding: {}'
+                             .format(encoding))
+        self.nb_types = nb_types
+        self.mode = mode
+        self.dtype = np.dtype(dtype)
+        self.encoding = encoding
+        self.overlays = tuple(overlays)
+        self.window = window
+        self.focus = focus
+        self.outside = outside
+        self.center = (0, 0)
+        self.base = None
+        self.reset(base)
+
+    @property
+    def shape(self):
+        if self.window is None:
+            shape = self.base.shape
+        else:
+            shape = (2 * self.window + 1,) * 2
+        if self.encoding == 'planes':
+            return shape + (self.nb_types,)
+        return shape
+
+    def space(self):
+        """この観測に合わせたobservation_space"""
+        import gym.spaces
+
+        high = 1 if self.encoding == 'planes' else self.nb_types
+        return gym.spaces.Box(low=0, high=high, shape=self.shape,
+                              dtype=self.dtype)
+
+    def reset(self, base=None):
+        """下地の状態に戻す. 違うMAPが来た時だけ配列を作り直す"""
+        if base is not None and base is not self.base:
+            self.base = base
+            pad = self.window or 0
+            # windowの時はMAPの周りをoutsideで囲み、座標はpadだけずらして持つ
+            padded = np.pad(base, pad, mode='constant',
+                            constant_values=self.outside)
+            if self.encoding == 'planes':
+                self._base = np.eye(self.nb_types, dtype=self.dtype)[padded]
+            else:
+                self._base = padded.astype(self.dtype)
+            self._inside = (slice(pad, pad + base.shape[0]),
+                            slice(pad, pad + base.shape[1]))
+            self.data = np.empty(self._base.shape, dtype=self.dtype)
+            self._view = self.data.view()
+            self._view.flags.writeable = False
+        self.data[...] = self._base
+
+    def _offset(self, pos):
+        if self.window is None:
+            return tuple(pos)
+        return tuple(int(p) + self.window for p in pos)
+
+    def set(self, pos, value):
+        if value == self.focus:
+            self.center = tuple(int(p) for p in pos)
+        pos = self._offset(pos)
+        if self.encoding == 'index':
+            self.data[pos] = value
+        elif value in self.overlays:
+            self.data[pos + (value,)] = 1
+        else:
+            self.data[pos] = 0
+            self.data[pos + (value,)] = 1
+
+    def restore(self, pos):
+        """そのマスを下地の値に戻す"""
+        pos = self._offset(pos)
+        self.data[pos] = self._base[pos]
+
+    def move(self, old_pos, new_pos, value):
+        self.restore(old_pos)
+        self.set(new_pos, value)
+
+    def _offset_many(self, positions):
+        rows, cols = np.asarray(positions).T
+        if self.window is not None:
+            rows, cols = rows + self.window, cols + self.window
+        return rows, cols
+
+    def set_many(self, positions, value):
+        """(K, 2) の座標に同じvalueをまとめて置く(敵をまとめて描く時用)"""
+        rows, cols = self._offset_many(positions)
+        if self.encoding == 'index':
+            self.data[rows, cols] = value
+        elif value in self.overlays:
+            self.data[rows, cols, value] = 1
+        else:
+            self.data[rows, cols] = 0
+            self.data[rows, cols, value] = 1
+
+    def restore_many(self, positions):
+        """(K, 2) の座標をまとめて下地の値に戻す"""
+        rows, cols = self._offset_many(positions)
+        self.data[rows, cols] = self._base[rows, cols]
+
+    def index(self):
+        """表示用にindex形式(H, W)の盤面(MAP全体)を返す.
+        重なったマスは番号の大きい方"""
+        data = self.data[self._inside]
+        if self.encoding == 'index':
+            return data
+        last = np.argmax(data[..., ::-1], axis=-1)
+        return self.nb_types - 1 - last
+
+    def get(self):
+        if self.window is None:
+            if self.mode == 'view':
+                return self._view
+            return self.data.copy()
+        # padだけずらしているので、中心(y, x)の窓は data[y:y+size, x:x+size]
+        y, x = self.center
+        size = 2 * self.window + 1
+        window = self.data[y:y + size, x:x + size]
+        if self.mode == 'view':
+            window = window.view()
+            window.flags.writeable = False
+            return window
+        return window.copy()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""MAPとDAMAGESが分かっている迷路を (セル, 受けたダメージ) 上の動的計画法で解く
+
+報酬とダメージはsampleEnv.MyEnvと同じ:
+    Goalに入った時 max(GOAL_REWARD - それまでのダメージ, 0) で終わり、それ以外は -1.
+    移動後のマスの地形でダメージを受ける.
+    MAX_DAMAGEを持つenv(env.MyEnv)では、ダメージがそれを超えたら終わり.
+ダメージは上限(MAX_DAMAGE+1 か GOAL_REWARD)で止めるので、解は厳密.
+敵(env.MyEnvのM)の動きは扱わない.
+
+    model = GridModel.from_env(env)
+    values, policy = value_iteration(model)
+    score(model, policy_from_q(q_values))  # DQNの方策を走らせずに採点する
+"""
+
+import numpy as np
+
+from myenv import terrain
+from myenv.observation import ObservationBuffer
+
+GOAL_REWARD = 100
+# terrain.MOVESの順の矢印
+ARROWS = np.array(['>', '<', 'v', '^'])
+
+
+def supports(env):
+    """GridModel.from_envで解けるenvか(地形のMAPとDAMAGESを持つ格子のenv)
+
+    敵(myenv-v1のnb_monsters)はモデルに入れていないので、敵がいると
+    最適値が正確でなくなる. その時は解けないことにする.
+    """
+    env = env.unwrapped
+    return hasattr(env, 'MAP') and hasattr(env, 'DAMAGES') and \
+        getattr(env, 'nb_monsters', 0) == 0
+
+
+class GridModel(object):
+    """(セル, ダメージ) を1つの状態番号にした遷移表
+
+    next_states[s, a, k], probs[s, a, k]: 地形のダメージを受けた(k=0)/
+    受けなかった(k=1)時の次の状態とその確率. terminals[s, a, k]: そこで終わるか.
+    rewards[s, a]: その時の報酬. 状態番号は cell * nb_damages + damage.
+    """
+
+    def __init__(self, field_map, field_types, damages, max_damage=None,
+                 goal_reward=GOAL_REWARD):
+        self.terrain = terrain.get_terrain(field_map, field_types, damages)
+        self.shape = field_map.shape
+        self.max_damage = max_damage
+        cap = goal_reward if max_damage is None else max_damage + 1
+        self.nb_damages = cap + 1
+        self.nb_cells = self.terrain.size
+        self.nb_states = self.nb_cells * self.nb_damages
+        self.start_cell = int(np.flatnonzero(
+            self.terrain.cells == field_types.index('S'))[0])
+        goal = field_types.index('G')
+
+        neighbors = self.terrain.neighbors()
+        nb_actions = neighbors.shape[1]
+        cells = np.arange(self.nb_cells)
+        damage = np.arange(self.nb_damages)
+        # (セル, action)
+        next_cells = neighbors.astype(np.int64)
+        goal_moves = (next_cells != cells[:, None]) & \
+            (self.terrain.cells[next_cells] == goal)
+        prob = self.terrain.damage_prob[next_cells]
+        # (セル, action, ダメージ, 受けた/受けなかった)
+        next_damage = damage[None, None, :, None] + np.stack(
+            [self.terrain.damage_hit[next_cells],
+             self.terrain.damage_miss[next_cells]], axis=-1)[:, :, None, :]
+        terminals = np.broadcast_to(goal_moves[:, :, None, None],
+                                    next_damage.shape)
+        if max_damage is not None:
+            terminals = terminals | (next_damage > max_damage)
+        next_damage = np.minimum(next_damage, cap)
+        next_states = next_cells[:, :, None, None] * self.nb_damages + \
+            next_damage
+        probs = np.broadcast_to(
+            np.stack([prob, 1. - prob], axis=-1)[:, :, None, :],
+            next_damage.shape)
+        rewards = np.where(goal_moves[:, :, None],
+                           np.maximum(goal_reward - damage, 0)[None, None],
+                           -1.)
+
+        # (セル, ダメージ, ...) の順にして状態番号で引けるようにする
+        self.next_states = next_states.transpose(0, 2, 1, 3).reshape(
+            self.nb_states, nb_actions, 2)
+        self.probs = probs.transpose(0, 2, 1, 3).reshape(
+            self.nb_states, nb_actions, 2)
+        self.terminals = terminals.transpose(0, 2, 1, 3).reshape(
+            self.nb_states, nb_actions, 2)
+        self.rewards = rewards.transpose(0, 2, 1).reshape(
+            self.nb_states, nb_actions).astype(np.float64)
+        # 終わらない時だけ次の価値を足す
+        self.continues = np.where(self.terminals, 0., self.probs)
+
+    @classmethod
+    def from_env(cls, env):
+        if not supports(env):
+            raise ValueError('Not supported such env: {}'.format(env))
+        env = env.unwrapped
+        return cls(env.MAP, env.FIELD_TYPES, env.DAMAGES,
+                   getattr(env, 'MAX_DAMAGE', None))
+
+    @property
+    def nb_actions(self):
+        return self.rewards.shape[1]
+
+    @property
+    def start_state(self):
+        return self.start_cell * self.nb_damages
+
+    def cell_policy(self, policy):
+        """セル毎の方策(ダメージを見ない)を状態毎に広げる"""
+        return np.repeat(np.asarray(policy), self.nb_damages)
+
+    def value_map(self, values, damage=0):
+        """ダメージdamageの時の価値をMAPの形にする"""
+        return values.reshape(self.nb_cells, self.nb_damages)[:, damage] \
+            .reshape(self.shape)
+
+    def policy_map(self, policy, damage=0):
+        """ダメージdamageの時の行動を矢印にしてMAPの形にする(山は空白)"""
+        actions = policy.reshape(self.nb_cells, self.nb_damages)[:, damage]
+        arrows = np.where(self.terrain.walkable(), ARROWS[actions], ' ')
+        return '\n'.join(' '.join(row) for row in arrows.reshape(self.shape))
+
+
+def lower_bound(model, gamma=0.99):
+    """毎step一番小さい報酬を受け続けた時の価値. 価値の初期値にすると、
+    Goalに着けない状態は最初から正しく、他も下から単調に収束する"""
+    return np.full(model.nb_states, min(model.rewards.min(), 0.) /
+                   (1. - gamma))
+
+
+def q_values(model, values, gamma=0.99):
+    return model.rewards + gamma * np.einsum(
+        'sak,sak->sa', model.continues, values[model.next_states])
+
+
+def value_iteration(model, gamma=0.99, tol=1e-6, max_iter=100000):
+    """最適な (価値, 方策). どちらも状態番号順の配列"""
+    values = lower_bound(model, gamma)
+    for _ in range(max_iter):
+        q = q_values(model, values, gamma)
+        new_values = q.max(axis=1)
+        delta = np.abs(new_values - values).max()
+        values = new_values
+        if delta < tol:
+            break
+    return values, q.argmax(axis=1)
+
+
+def evaluate_policy(model, policy, gamma=0.99, tol=1e-6, max_iter=100000):
+    """状態毎の方策policyの価値"""
+    states = np.arange(model.nb_states)
+    rewards = model.rewards[states, policy]
+    next_states = model.next_states[states, policy]
+    continues = model.continues[states, policy]
+    values = lower_bound(model, gamma)
+    for _ in range(max_iter):
+        new_values = rewards + gamma * np.einsum(
+            'sk,sk->s', continues, values[next_states])
+        delta = np.abs(new_values - values).max()
+        values = new_values
+        if delta < tol:
+            break
+    return values
+
+
+def policy_iteration(model, gamma=0.99, tol=1e-6, max_iter=1000):
+    """value_iterationと同じ解を、方策の評価と改善の繰り返しで求める"""
+    policy = np.zeros(model.nb_states, dtype=np.int64)
+    for _ in range(max_iter):
+        values = evaluate_policy(model, policy, gamma, tol)
+        new_policy = q_values(model, values, gamma).argmax(axis=1)
+        if (new_policy == policy).all():
+            break
+        policy = new_policy
+    return values, policy
+
+
+def cell_observations(env):
+    """勇者を各セルに置いた時の観測(セル番号順). 他の重ねる物は今の位置のまま"""
+    env = env.unwrapped
+    hero = env.FIELD_TYPES.index('Y')
+    observer = env.observer
+    buffer = ObservationBuffer(env.MAP, len(env.FIELD_TYPES), 'buffer',
+                               observer.dtype, observer.encoding,
+                               observer.overlays, observer.window,
+                               observer.focus, observer.outside)
+    observations = []
+    for cell in range(env.MAP.size):
+        buffer.reset()
+        if hasattr(env, 'mon_pos'):
+            buffer.set_many(env.mon_pos, env.FIELD_TYPES.index('M'))
+        buffer.set(divmod(cell, env.MAP.shape[1]), hero)
+        observations.append(buffer.get())
+    return np.array(observations)
+
+
+def policy_from_q(q_values):
+    """(セル, action) のQ値からセル毎のgreedyな方策"""
+    return np.argmax(q_values, axis=-1)
+
+
+def score(model, cell_policy, gamma=0.99, optimal=None):
+    """セル毎の方策を、Startでの価値で最適解と比べる"""
+    if optimal is None:
+        optimal, _ = value_iteration(model, gamma)
+    values = evaluate_policy(model, model.cell_policy(cell_policy), gamma)
+    start = model.start_state
+    return {'value': float(values[start]),
+            'optimal': float(optimal[start]),
+            'gap': float(optimal[start] - values[start])}
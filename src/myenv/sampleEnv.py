@@ -3,14 +3,19 @@
 
 import sys
 import gym
+from io import StringIO
 import numpy as np
 import gym.spaces
 
+from myenv import terrain
+from myenv.observation import ObservationBuffer
+
 
 class MyEnv(gym.Env):
     # human: 画面表示のため.戻り値なし
     # ansi: 文字列 or StringIOを返す
-    metadata = {'render.modes': ['human', 'ansi']}
+    # frame: FIELD_TYPESの番号を入れたuint8の配列を返す(録画用)
+    metadata = {'render.modes': ['human', 'ansi', 'frame']}
     FIELD_TYPES = [
         'S',  # 0: Start
         'G',  # 1: Goal
@@ -30,57 +35,70 @@ class MyEnv(gym.Env):
         [2, 2, 2, 2, 2, 2, 4, 4, 2, 2, 2, 2],
     ])
     MAX_STEPS = 100
-
-    def __init__(self):
-        """action空間と観測空間、報酬のmin,maxのリスト"""
+    # 地形ごとの (Damageを受ける確率, 受けた時のDamage, 受けなかった時のDamage)
+    DAMAGES = {
+        '~': (1/10., 10, 0),
+        'w': (1/2., 10, 0),
+        '=': (1/2., 11, 1),
+    }
+
+    def __init__(self, obs_mode='buffer', obs_dtype='uint8',
+                 obs_encoding='index', obs_window=None):
+        """action空間と観測空間、報酬のmin,maxのリスト
+
+        obs_windowを指定すると、観測は勇者の周り(2*obs_window+1)四方だけ
+        (MAPの外は山に見える).
+        """
         super().__init__()
+        self.observer = ObservationBuffer(
+            self.MAP, len(self.FIELD_TYPES), obs_mode, obs_dtype,
+            obs_encoding, overlays=[self.FIELD_TYPES.index('Y')],
+            window=obs_window, focus=self.FIELD_TYPES.index('Y'),
+            outside=self.FIELD_TYPES.index('A'))
         self.action_space = gym.spaces.Discrete(4)
-        self.observation_space = gym.spaces.Box(
-            low=0,
-            high=len(self.FIELD_TYPES),
-            shape=self.MAP.shape
-            )
+        self.observation_space = self.observer.space()
         self.reward_range = [-1., 100.]
         self._reset()
 
     def _reset(self):
         """状態を初期化し、初期の観測値を返す"""
+        self.terrain = terrain.get_terrain(
+            self.MAP, self.FIELD_TYPES, self.DAMAGES)
+        self.neighbors = self.terrain.neighbors()
         self.pos = self._find_pos('S')[0]
         self.goal = self._find_pos('G')[0]
         self.done = False
         self.damage = 0
         self.steps = 0
+        self.observer.reset(self.MAP)
+        self.observer.set(self.pos, self.FIELD_TYPES.index('Y'))
         return self._observe()
 
     def _step(self, action):
-        # 1stepの処理
-        if action == 0:
-            next_pos = self.pos + [0, 1]
-        elif action == 1:
-            next_pos = self.pos + [0, -1]
-        elif action == 2:
-            next_pos = self.pos + [1, 0]
-        elif action == 3:
-            next_pos = self.pos + [-1, 0]
-
-        if self._is_movable(next_pos):
-            self.pos = next_pos
-            moved = True
-        else:
-            moved = False
+        # 1stepの処理. 移動先は参照表から引く
+        cell = self.terrain.cell(self.pos)
+        next_cell = self.neighbors[cell, action]
+        moved = next_cell != cell
+        if moved:
+            self.observer.move(self.pos, self.terrain.pos(next_cell),
+                               self.FIELD_TYPES.index('Y'))
+            self.pos = self.terrain.pos(next_cell)
 
         observation = self._observe()
         reward = self._get_reward(self.pos, moved)
-        self.damage += self._get_damage(self.pos)
+        damage = self._get_damage(self.pos)
+        self.damage += damage
         self.done = self._is_done()
-        return observation, reward, self.done, {}
+        return observation, reward, self.done, {'damage': damage}
 
     def _render(self, mode='human', close=False):
         """環境を可視化する"""
+        if mode == 'frame':
+            return self.observer.index().astype(np.uint8)
         outfile = StringIO() if mode == 'ansi' else sys.stdout
         outfile.write('\n'.join(' '.join(
                 self.FIELD_TYPES[elem] for elem in row
-                ) for row in self._observe()
+                ) for row in self.observer.index()
             ) + '\n\n'
         )
         return outfile
@@ -100,31 +118,19 @@ class MyEnv(gym.Env):
 
     def _get_damage(self, pos):
         """ダメージ計算"""
-        field_type = self.FIELD_TYPES[self.MAP[tuple(pos)]]
-        if field_type == 'S':
-            return 0
-        elif field_type == 'G':
-            return 0
-        elif field_type == '~':
-            return 10 if np.random.random() < 1/10. else 0
-        elif field_type == 'w':
-            return 10 if np.random.random() < 1/2. else 0
-        elif field_type == '=':
-            return 11 if np.random.random() < 1/2. else 1
+        return self.terrain.damage(self.terrain.cell(pos))
 
     def _is_movable(self, pos):
         """移動できるかの確認"""
         return (
             0 <= pos[0] < self.MAP.shape[0]
             and 0 <= pos[1] < self.MAP.shape[1]
-            and self.FIELD_TYPES[self.MAP[tuple(pos)]] != 'A'
+            and self.terrain.walkable()[self.terrain.cell(pos)]
         )
 
     def _observe(self):
-        """マップに勇者の位置を重ねて返す"""
-        observation = self.MAP.copy()
-        observation[tuple(self.pos)] = self.FIELD_TYPES.index('Y')
-        return observation
+        """マップに勇者の位置を重ねて返す(重ねる処理はstep毎に差分だけ)"""
+        return self.observer.get()
 
     def _is_done(self):
         if (self.pos == self.goal).all():
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""envAdの盤(bitboard)を読むalpha-beta探索の相手
+
+negamaxで、手番の側の石をme, 相手の石をoppとして数手先まで読む.
+既に石のあるマスには置かない(置くとmissで負けるので).
+読み切れない所は、相手の石が無いラインに自分の石が多いほど良いとする評価値.
+探索した局面はSymmetryで8つの対称形を1つにまとめた盤をキーにして
+TranspositionTableに入れる. 表は大きさに上限があり、古い物から捨てる(LRU).
+
+    player = AlphaBeta(BitBoard(), depth=2)
+    cell = player.move(board.boards[1], board.boards[0])  # 後手の手
+"""
+
+from collections import OrderedDict
+
+from myenv.bitboard import Symmetry
+
+WIN = 1000000
+# ラインにある自分の石の数 -> 評価値
+LINE_WEIGHTS = (0, 1, 4, 16, 64, 256)
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+class TranspositionTable(object):
+    """canonicalな盤 -> (深さ, 評価値, 種類, 最善手) のLRU"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+
+class AlphaBeta(object):
+    """BitBoardと同じラインで勝ちを判定し、depth手先まで読んで手を選ぶ"""
+
+    def __init__(self, board, depth=2, table_size=100000):
+        self.size = board.size
+        self.full = board.full
+        self.masks = board.masks
+        self.cell_masks = board.cell_masks
+        self.depth = depth
+        self.symmetry = Symmetry(board.size)
+        self.table = TranspositionTable(table_size)
+        self.nb_nodes = 0
+
+    def move(self, me, opp):
+        """手番の側の石me, 相手の石oppの盤で置くマスを返す"""
+        _, cell = self._search(me, opp, self.depth, -WIN * 2, WIN * 2)
+        return cell
+
+    def evaluate(self, me, opp):
+        """読み切らない局面の、手番の側から見た評価値"""
+        score = 0
+        for mask in self.masks:
+            if not mask & opp:
+                score += LINE_WEIGHTS[popcount(mask & me)]
+            elif not mask & me:
+                score -= LINE_WEIGHTS[popcount(mask & opp)]
+        return score
+
+    def _wins(self, board, cell):
+        for mask in self.cell_masks[cell]:
+            if board & mask == mask:
+                return True
+        return False
+
+    def _moves(self, me, opp, best):
+        empty = self.full & ~(me | opp)
+        cells = [cell for cell in range(self.size * self.size)
+                 if empty >> cell & 1]
+        if best is not None and best in cells:
+            cells.remove(best)
+            cells.insert(0, best)
+        return cells
+
+    def _search(self, me, opp, depth, alpha, beta):
+        """(評価値, 最善手). 最善手は置ける所が無ければNone"""
+        self.nb_nodes += 1
+        if not self.full & ~(me | opp):
+            return 0, None
+        if depth == 0:
+            return self.evaluate(me, opp), None
+
+        key, k = self.symmetry.canonical((me, opp))
+        entry = self.table.get(key)
+        best = None
+        if entry is not None:
+            entry_depth, value, flag, canonical_move = entry
+            best = self.symmetry.source_cell(canonical_move, k)
+            if entry_depth >= depth and (
+                    flag == EXACT or
+                    (flag == LOWER and value >= beta) or
+                    (flag == UPPER and value <= alpha)):
+                return value, best
+
+        original_alpha = alpha
+        best_value = -WIN * 2
+        for cell in self._moves(me, opp, best):
+            placed = me | 1 << cell
+            if self._wins(placed, cell):
+                # 早く勝つ方を良くする
+                value = WIN + depth
+            else:
+                value, _ = self._search(opp, placed, depth - 1, -beta,
+                                        -alpha)
+                value = -value
+            if value > best_value:
+                best_value, best = value, cell
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, (depth, best_value, flag,
+                             self.symmetry.cell(best, k)))
+        return best_value, best
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import weakref
+import numpy as np
+
+# action 0..3 の移動量 (MyEnv._step の if/elif と同じ順)
+MOVES = np.array([[0, 1], [0, -1], [1, 0], [-1, 0]])
+
+# id(MAP), id(DAMAGES) -> (MAPへの弱参照, Terrain)
+_CACHE = {}
+
+
+class Terrain(object):
+    """1つのMAPから作る参照表. stepはこの表の添字だけで済ませる"""
+
+    def __init__(self, field_map, field_types, damages):
+        self.shape = field_map.shape
+        self.field_types = field_types
+        self.cells = field_map.ravel()
+        self.size = self.cells.size
+
+        # 地形ごとの (Damageを受ける確率, 受けた時, 受けなかった時)
+        table = np.array([damages.get(field_type, (0., 0, 0))
+                          for field_type in field_types])
+        self.damage_prob = table[self.cells, 0]
+        self.damage_hit = table[self.cells, 1].astype(np.int64)
+        self.damage_miss = table[self.cells, 2].astype(np.int64)
+        self._walkable = {}
+        self._neighbors = {}
+
+    def walkable(self, blocked=('A',)):
+        """blockedに含まれない地形のマスだけTrueのマスク(セル番号順)"""
+        blocked = tuple(blocked)
+        if blocked not in self._walkable:
+            lut = np.array([field_type not in blocked
+                            for field_type in self.field_types])
+            self._walkable[blocked] = lut[self.cells]
+        return self._walkable[blocked]
+
+    def neighbors(self, blocked=('A',)):
+        """(セル, action) -> 移動先のセル. 動けない時は元のセル"""
+        blocked = tuple(blocked)
+        if blocked not in self._neighbors:
+            height, width = self.shape
+            walkable = self.walkable(blocked)
+            rows, cols = np.divmod(np.arange(self.size), width)
+            next_rows = rows[:, None] + MOVES[:, 0]
+            next_cols = cols[:, None] + MOVES[:, 1]
+            in_map = ((0 <= next_rows) & (next_rows < height)
+                      & (0 <= next_cols) & (next_cols < width))
+            next_cells = (np.clip(next_rows, 0, height - 1) * width
+                          + np.clip(next_cols, 0, width - 1))
+            movable = in_map & walkable[next_cells]
+            table = np.where(movable, next_cells, np.arange(self.size)[:, None])
+            self._neighbors[blocked] = table.astype(
+                np.int32 if self.size < 2 ** 31 else np.int64)
+        return self._neighbors[blocked]
+
+    def cell(self, pos):
+        """座標 -> セル番号"""
+        return pos[0] * self.shape[1] + pos[1]
+
+    def pos(self, cell):
+        """セル番号 -> 座標"""
+        return np.array(divmod(int(cell), self.shape[1]))
+
+    def damage(self, cell, random=np.random.random):
+        """そのセルで受けるダメージ. 確率が0か1の時は乱数を引かない"""
+        prob = self.damage_prob[cell]
+        if 0. < prob < 1.:
+            hit = random() < prob
+        else:
+            hit = prob >= 1.
+        return int(self.damage_hit[cell] if hit else self.damage_miss[cell])
+
+
+def get_terrain(field_map, field_types, damages):
+    """MAPごとに1度だけ参照表を作り、全てのenvで共有する"""
+    key = (id(field_map), id(damages))
+    entry = _CACHE.get(key)
+    if entry is None or entry[0]() is not field_map:
+        ref = weakref.ref(field_map, lambda _: _CACHE.pop(key, None))
+        entry = (ref, Terrain(field_map, field_types, damages))
+        _CACHE[key] = entry
+    return entry[1]
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import sys
+import gym
+import numpy as np
+import gym.spaces
+
+from myenv import sampleEnv, terrain
+
+
+class VecMyEnv(object):
+    """sampleEnv.MyEnvをN個まとめて、1回のstepで全エージェントを動かす"""
+    FIELD_TYPES = sampleEnv.MyEnv.FIELD_TYPES
+    MAP = sampleEnv.MyEnv.MAP
+    MAX_STEPS = sampleEnv.MyEnv.MAX_STEPS
+    DAMAGES = sampleEnv.MyEnv.DAMAGES
+
+    def __init__(self, num_envs, obs_dtype='uint8'):
+        """N個分の状態を配列で持つ"""
+        self.num_envs = num_envs
+        self.action_space = gym.spaces.Discrete(4)
+        self.observation_space = gym.spaces.Box(
+            low=0,
+            high=len(self.FIELD_TYPES),
+            shape=self.MAP.shape,
+            dtype=obs_dtype
+            )
+        self.reward_range = [-1., 100.]
+
+        self.start = self._find_pos('S')[0]
+        self.goal = self._find_pos('G')[0]
+        self._hero = self.FIELD_TYPES.index('Y')
+        self._index = np.arange(num_envs)
+        self.pos = np.empty((num_envs, 2), dtype=np.int64)
+        self.damage = np.empty(num_envs, dtype=np.int64)
+        self.steps = np.empty(num_envs, dtype=np.int64)
+        self.done = np.empty(num_envs, dtype=bool)
+        self._obs = np.empty((num_envs,) + self.MAP.shape, dtype=obs_dtype)
+        self.seed()
+        self.reset()
+
+    def seed(self, seed=None):
+        self.np_random = np.random.RandomState(seed)
+        return [seed]
+
+    def reset(self):
+        """全ての環境を初期化し、観測値(N, H, W)を返す"""
+        self.terrain = terrain.get_terrain(
+            self.MAP, self.FIELD_TYPES, self.DAMAGES)
+        self.neighbors = self.terrain.neighbors()
+        self.pos[:] = self.start
+        self.damage[:] = 0
+        self.steps[:] = 0
+        self.done[:] = False
+        self._obs[:] = self.MAP
+        self._obs[self._index, self.pos[:, 0], self.pos[:, 1]] = self._hero
+        return self._obs.copy()
+
+    def step(self, actions):
+        """N個のactionをまとめて実行し、終わった環境は自動でresetする"""
+        width = self.MAP.shape[1]
+        cell = self.pos[:, 0] * width + self.pos[:, 1]
+        next_cell = self.neighbors[cell, np.asarray(actions)]
+        moved = next_cell != cell
+
+        old_pos = self.pos.copy()
+        self.pos[:, 0], self.pos[:, 1] = np.divmod(next_cell, width)
+        self._obs[self._index, old_pos[:, 0], old_pos[:, 1]] = \
+            self.MAP[old_pos[:, 0], old_pos[:, 1]]
+        self._obs[self._index, self.pos[:, 0], self.pos[:, 1]] = self._hero
+
+        at_goal = (self.pos == self.goal).all(axis=1)
+        rewards = np.where(moved & at_goal,
+                           np.maximum(100 - self.damage, 0), -1)
+
+        hit = self.np_random.random_sample(self.num_envs) \
+            < self.terrain.damage_prob[next_cell]
+        self.damage += np.where(hit, self.terrain.damage_hit[next_cell],
+                                self.terrain.damage_miss[next_cell])
+        self.steps += 1
+        self.done = at_goal | (self.steps > self.MAX_STEPS)
+
+        dones = self.done.copy()
+        info = {
+            'damage': self.damage.copy(),
+            'terminal_observation': self._obs[dones].copy(),
+            }
+        if dones.any():
+            self._reset_done(dones)
+        return self._obs.copy(), rewards, dones, info
+
+    def render(self, mode='human'):
+        """環境を可視化する"""
+        outfile = sys.stdout
+        outfile.write('\n\n'.join('\n'.join(' '.join(
+                self.FIELD_TYPES[elem] for elem in row
+                ) for row in obs) for obs in self._obs
+            ) + '\n\n'
+        )
+        return outfile
+
+    def close(self):
+        pass
+
+    def _reset_done(self, dones):
+        """終わった環境だけを初期状態に戻す"""
+        index = self._index[dones]
+        pos = self.pos[index]
+        self._obs[index, pos[:, 0], pos[:, 1]] = self.MAP[pos[:, 0], pos[:, 1]]
+        self.pos[index] = self.start
+        self.damage[index] = 0
+        self.steps[index] = 0
+        self.done[index] = False
+        self._obs[index, self.start[0], self.start[1]] = self._hero
+
+    def _find_pos(self, field_type):
+        return np.array(list(zip(*np.where(
+            self.MAP == self.FIELD_TYPES.index(field_type)
+            ))))
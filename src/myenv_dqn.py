@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+"""myenvのDQNの入口. --envで環境を選ぶ
+
+keras/TensorFlow, gym, keras-rl は使う所で読み込むので、--help などは
+すぐに終わる.
+"""
+
+import argparse
+import functools
+from enum import Enum
+
+ENV_NAME = 'myenv-v0'
+# envごとのモデルの設定 (units: 隠れ層の幅)
+PRESETS = {
+    'myenv-v0': {'units': 16},
+    'myenv-v1': {'units': 32},
+    'myenv-v2': {'units': 16},
+    'myenv-v3': {'units': 32},
+}
+
+
+class MYSTR(Enum):
+    MYPROGRAM_NAME = 'MYPROGRAM'
+    USAGE = 'DQN'
+    DESCRIPTION = 'description'
+    EPILOG = 'end'
+
+    SEED = 123
+    TRAIN = 'TRAIN'
+    TEST = 'TEST'
+    SWEEP = 'SWEEP'
+    ORACLE = 'ORACLE'
+    EXPORT = 'EXPORT'
+
+
+class OUTMSG(Enum):
+    OUTPUT_HEADER = '[OUTPUT]: '
+    ACTIONS_OP_MSG = 'actions are: '
+    OBSERVE_OP_MSG = 'observetions are: '
+    REWARDS_OP_MSG = 'rewards are: '
+    MEMORY_OP_MSG = 'replay memory uses '
+    SUMMARY_OP_MSG = 'episode summary'
+    QCACHE_OP_MSG = 'q-value cache hit rate: '
+    ORACLE_OP_MSG = 'value at the start (trained / optimal / gap): '
+    RESUME_OP_MSG = 'resumed from '
+    EXPORT_OP_MSG = 'policy written to '
+
+
+class ERRMSG(Enum):
+    ERROR_HEADER = '[ERROR]: '
+    EXEC_ERROR = 'Not supported such exec type.'
+    ORACLE_ENV_ERROR = ('ORACLE needs a grid env with terrain damages '
+                        'and no monsters (myenv-v0, myenv-v3, or myenv-v1 '
+                        'with --nb-monsters 0).')
+    ACTORS_MEMORY_ERROR = ('--actors keeps its own ring memory per actor; '
+                           'it cannot be used with --memory prioritized, '
+                           '--memory symmetric or --memory-dir.')
+    MEMORY_DIR_ERROR = '--memory-dir needs --memory ring or prioritized.'
+    ACTORS_CHECKPOINT_ERROR = ('--actors does not write or resume '
+                               'checkpoints; drop --checkpoint-interval '
+                               'and --resume.')
+    ACTORS_CALLBACK_ERROR = ('--actors runs no callbacks in the actors; '
+                             'it cannot be used with --render or '
+                             '--profile.')
+
+
+def myperser():
+    parser = argparse.ArgumentParser(
+                prog=MYSTR.MYPROGRAM_NAME.value,
+                description=MYSTR.DESCRIPTION.value,
+                epilog=MYSTR.EPILOG.value,
+                add_help=True,
+                )
+    parser.add_argument('--env', default=ENV_NAME, choices=sorted(PRESETS),
+                        help='environment id')
+    parser.add_argument('-s', '--nb-steps', type=int, default=50000,
+                        help='step count')
+    parser.add_argument('-l', '--limit', type=int, default=50000,
+                        help='memory limit')
+    parser.add_argument('-m', '--memory', default='ring',
+                        choices=['ring', 'prioritized', 'sequential',
+                                 'symmetric'],
+                        help='replay memory type (symmetric: myenv-v2, '
+                             'every transition also stored in its 7 '
+                             'mirrored/rotated forms)')
+    parser.add_argument('-md', '--memory-dir', default=None,
+                        help='keep the replay memory in this directory '
+                             'and resume from it on the next TRAIN run '
+                             '(ring or prioritized)')
+    parser.add_argument('-a', '--actors', type=int, default=0,
+                        help='TRAIN with this many actor processes '
+                             'and one learner, each actor with its own '
+                             'ring memory (0: single process)')
+    parser.add_argument('-wl', '--window-length', type=int, default=1,
+                        help='window length')
+    parser.add_argument('-u', '--target-model-update', type=float,
+                        default=1e-2, help='target models update rate')
+    parser.add_argument('-r', '--learning-rate', type=float,
+                        default=1e-3, help='deep learnings learning rate')
+    parser.add_argument('-wu', '--warmup', type=int, default=10,
+                        help='warmup number')
+    parser.add_argument('-te', '--nb-episodes', type=int, default=5,
+                        help='dqn test episodes')
+    parser.add_argument('-e', '--exec-type',
+                        help='TRAIN, TEST, SWEEP, ORACLE (score the trained '
+                             'policy by value iteration, myenv-v0/v3 or '
+                             'myenv-v1 with --nb-monsters 0) or '
+                             'EXPORT (write the weights as a numpy-only '
+                             'policy file)')
+    parser.add_argument('-fp', '--frozen-policy', default=None,
+                        help='EXPORT: output file (default: '
+                             'policy_<env>.npz). TEST: run this exported '
+                             'policy without keras')
+    parser.add_argument('-ew', '--eval-workers', type=int, default=0,
+                        help='TEST greedily in this many processes '
+                             'with per-episode seeds (0: dqn.test)')
+    parser.add_argument('-ms', '--max-steps', type=int, default=10000,
+                        help='step limit of an episode with --eval-workers')
+    parser.add_argument('-lm', '--log-mode', default='aggregate',
+                        choices=['aggregate', 'full'],
+                        help='TEST logging: summary table or every step')
+    parser.add_argument('-el', '--episode-log', default=None,
+                        help='with --log-mode full, stream TEST episodes '
+                             'to this directory '
+                             'instead of keeping them in memory')
+    parser.add_argument('-qc', '--q-cache', type=int, default=0,
+                        help='cache the q-values of this many states for '
+                             'action selection (0: off)')
+    parser.add_argument('-qs', '--q-cache-staleness', type=int, default=1,
+                        help='drop the q-value cache every N train steps')
+    parser.add_argument('-ni', '--numpy-inference', action='store_true',
+                        help='compute the q-values for action selection '
+                             'with numpy instead of keras')
+    parser.add_argument('-ci', '--checkpoint-interval', type=int, default=0,
+                        help='TRAIN: write a checkpoint every N steps '
+                             'in a background thread (0: off, not with '
+                             '--actors)')
+    parser.add_argument('-cd', '--checkpoint-dir', default=None,
+                        help='checkpoint directory '
+                             '(default: checkpoints_<env>)')
+    parser.add_argument('-ck', '--checkpoint-keep', type=int, default=3,
+                        help='keep this many newest checkpoints')
+    parser.add_argument('-rs', '--resume', action='store_true',
+                        help='TRAIN: continue from the newest checkpoint '
+                             '(weights, optimizer, step, exploration; '
+                             'not with --actors)')
+    parser.add_argument('-rd', '--render', default=None,
+                        choices=['off', 'step', 'episode', 'record'],
+                        help='off, draw every Nth step, draw every Nth '
+                             'episode, or record frames to --frames '
+                             '(default: step, off with --actors)')
+    parser.add_argument('-re', '--render-every', type=int, default=1,
+                        help='N of --render')
+    parser.add_argument('-fr', '--frames', default=None,
+                        help='--render record file '
+                             '(default: frames_<env>_train.bin or '
+                             'frames_<env>_test.bin, play it with '
+                             'python frames.py <file>)')
+    parser.add_argument('-pf', '--profile', action='store_true',
+                        help='time env.step, predict, append, sample and '
+                             'train and print a table every '
+                             '--profile-interval steps')
+    parser.add_argument('-pi', '--profile-interval', type=int, default=10000,
+                        help='steps between --profile tables')
+    parser.add_argument('-pt', '--profile-trace', default=None,
+                        help='Chrome trace-event JSON of --profile '
+                             '(default: profile_<env>.json)')
+    parser.add_argument('-ts', '--trace-start', type=int, default=1000,
+                        help='first step written to --profile-trace')
+    parser.add_argument('-tn', '--trace-steps', type=int, default=200,
+                        help='steps written to --profile-trace')
+    parser.add_argument('-ss', '--sweep-spec', default=None,
+                        help='SWEEP: grid or random search spec (JSON)')
+    parser.add_argument('-so', '--sweep-out', default='sweep_results',
+                        help='SWEEP: write <this>.csv and <this>.json')
+    parser.add_argument('-sw', '--sweep-workers', type=int, default=0,
+                        help='SWEEP: trials run at once (0: cores/threads)')
+    parser.add_argument('-st', '--sweep-threads', type=int, default=1,
+                        help='SWEEP: BLAS/TensorFlow threads per trial')
+    parser.add_argument('-v', '--verbose', type=int, default=2,
+                        help='select mode')
+    parser.add_argument('-od', '--obs-dtype', default='uint8',
+                        help='observation dtype')
+    parser.add_argument('-oe', '--obs-encoding', default='index',
+                        choices=['index', 'planes'],
+                        help='observation encoding')
+    parser.add_argument('-ow', '--obs-window', type=int, default=None,
+                        help='observe only the (2N+1)x(2N+1) cells around '
+                             'the hero (myenv-v0/v3, v3 default: 5)')
+    parser.add_argument('-mz', '--map-size', type=int, nargs=2, default=None,
+                        metavar=('HEIGHT', 'WIDTH'),
+                        help='myenv-v3: generated map size (default: 64 64)')
+    parser.add_argument('-mg', '--map-seed', type=int, default=None,
+                        help='myenv-v3: map generator seed (default: 0)')
+    parser.add_argument('-nm', '--nb-monsters', type=int, default=None,
+                        help='myenv-v1: number of monsters (default: 1)')
+    parser.add_argument('-sp', '--spawn', default=None,
+                        choices=['goal', 'random'],
+                        help='myenv-v1: monsters start on the goal or on '
+                             'random cells (default: goal)')
+    parser.add_argument('-op', '--opponent', default=None,
+                        choices=['alphabeta'],
+                        help='myenv-v2: let an alpha-beta search play the '
+                             'second player')
+    parser.add_argument('-dp', '--opponent-depth', type=int, default=None,
+                        help='myenv-v2: plies searched by --opponent '
+                             '(default: 2)')
+    return parser
+
+
+def env_kwargs_of(args):
+    """argsからenvのコンストラクタに渡す引数を作る(指定された物だけ)"""
+    env_kwargs = {'obs_dtype': args.obs_dtype,
+                  'obs_encoding': args.obs_encoding}
+    if args.obs_window is not None:
+        env_kwargs['obs_window'] = args.obs_window
+    if args.map_size is not None:
+        env_kwargs['height'], env_kwargs['width'] = args.map_size
+    if args.map_seed is not None:
+        env_kwargs['map_seed'] = args.map_seed
+    if args.nb_monsters is not None:
+        env_kwargs['nb_monsters'] = args.nb_monsters
+    if args.spawn is not None:
+        env_kwargs['spawn'] = args.spawn
+    if args.opponent is not None:
+        env_kwargs['opponent'] = args.opponent
+    if args.opponent_depth is not None:
+        env_kwargs['opponent_depth'] = args.opponent_depth
+    return env_kwargs
+
+
+def create_model(env, action_n, window_length=1, units=16):
+    from keras.layers import Input, Dense, Flatten
+    from keras.models import Model
+
+    in_ = Input(shape=(window_length,) + env.observation_space.shape,
+                name='input')
+    fl_ = Flatten()(in_)
+    dn_ = Dense(units, activation='relu')(fl_)
+    dn_ = Dense(units, activation='relu')(dn_)
+    dn_ = Dense(units, activation='relu')(dn_)
+    ou_ = Dense(action_n, activation='linear')(dn_)
+    return Model(inputs=in_, outputs=ou_)
+
+
+def model_factory(env_name):
+    """env_nameの設定でcreate_modelを呼ぶ関数(actorやworkerに渡す)"""
+    return functools.partial(create_model, **PRESETS[env_name])
+
+
+# --memory-dirで配列をファイルに置けるmemory
+STORED_MEMORIES = ('ring', 'prioritized')
+
+
+def create_memory(memory_type, limit, window_length, nb_steps,
+                  memory_dir=None, env=None):
+    import replay
+    from rl.memory import SequentialMemory
+
+    storage = None
+    if memory_dir is not None:
+        if memory_type not in STORED_MEMORIES:
+            raise ValueError('--memory-dir needs --memory {}'.format(
+                ' or '.join(STORED_MEMORIES)))
+        storage = replay.MemmapStorage(memory_dir)
+    if memory_type == 'ring':
+        return replay.RingMemory(limit, storage=storage,
+                                 window_length=window_length)
+    if memory_type == 'prioritized':
+        return replay.PrioritizedMemory(limit, beta_steps=nb_steps,
+                                        storage=storage,
+                                        window_length=window_length)
+    if memory_type == 'symmetric':
+        if not hasattr(env.unwrapped, 'symmetry_transforms'):
+            raise ValueError('--memory symmetric needs a board env '
+                             '(myenv-v2)')
+        return replay.SymmetryAugmentedMemory(
+            limit, env.unwrapped.symmetry_transforms(),
+            window_length=window_length)
+    return SequentialMemory(limit=limit, window_length=window_length)
+
+
+def create_dqn(args, env):
+    import agent
+    from keras.optimizers import Adam
+    from rl.policy import BoltzmannQPolicy
+
+    nb_actions = env.action_space.n
+    model = model_factory(args.env)(env, nb_actions, args.window_length)
+    memory = create_memory(args.memory, args.limit, args.window_length,
+                           args.nb_steps, args.memory_dir, env)
+    policy = BoltzmannQPolicy()
+    dqn = agent.MyDQNAgent(model=model,
+                           nb_actions=nb_actions,
+                           memory=memory,
+                           nb_steps_warmup=args.warmup,
+                           target_model_update=args.target_model_update,
+                           policy=policy,
+                           q_cache_size=args.q_cache,
+                           q_cache_staleness=args.q_cache_staleness,
+                           numpy_inference=args.numpy_inference)
+    dqn.compile(Adam(lr=args.learning_rate), metrics=['mae'])
+    return dqn
+
+
+def create_render_policy(mode, every, path):
+    import frames
+    import logger
+
+    recorder = frames.FrameRecorder(path) if mode == 'record' else None
+    return logger.RenderPolicy(mode, every, recorder)
+
+
+def exec_dqn(trainOrTest, env, dqn, nb_steps, verbose, episodes, *,
+             episode_log=None, log_mode='aggregate', actors=0,
+             env_kwargs=None, eval_workers=0, max_steps=10000,
+             env_name=ENV_NAME, render='step', render_every=1,
+             frames_path=None, profile=None, checkpoint_interval=0,
+             checkpoint_dir=None, checkpoint_keep=3, resume=False,
+             frozen_path=None):
+    weights_path = 'dqn_{}_weights.h5f'.format(env_name)
+    # TESTでTRAINの録画を上書きしないよう、既定のファイル名を分ける
+    frames_path = frames_path or 'frames_{}_{}.bin'.format(
+        env_name, trainOrTest.lower())
+    checkpoint_dir = checkpoint_dir or 'checkpoints_{}'.format(env_name)
+    extra_callbacks = [] if profile is None else [profile]
+    if trainOrTest == MYSTR.TRAIN.value:
+        import checkpoint
+
+        if resume:
+            path = checkpoint.latest(checkpoint_dir)
+            if path is None:
+                print(OUTMSG.OUTPUT_HEADER.value +
+                      'no checkpoint in {}, starting from step 0'.format(
+                          checkpoint_dir))
+            else:
+                step = checkpoint.restore(dqn, path)
+                print(OUTMSG.OUTPUT_HEADER.value +
+                      OUTMSG.RESUME_OP_MSG.value +
+                      '{} (step {})'.format(path, step))
+        if checkpoint_interval > 0:
+            extra_callbacks.append(checkpoint.CheckpointCallback(
+                checkpoint.CheckpointWriter(checkpoint_dir, checkpoint_keep),
+                checkpoint_interval))
+        if actors > 0:
+            import apex
+
+            apex.train(dqn, env_name, env_kwargs or {},
+                       model_factory(env_name), actors, nb_steps,
+                       seed=MYSTR.SEED.value, verbose=verbose,
+                       numpy_inference=dqn.numpy_model is not None)
+        else:
+            dqn.fit(env, nb_steps=nb_steps,
+                    visualize=False,
+                    verbose=verbose,
+                    callbacks=[create_render_policy(render, render_every,
+                                                    frames_path)] +
+                    extra_callbacks)
+        dqn.save_weights(weights_path, overwrite=True)
+        if hasattr(dqn.memory, 'close'):
+            dqn.memory.close()
+        if hasattr(dqn.memory, 'nbytes'):
+            print(OUTMSG.OUTPUT_HEADER.value +
+                  OUTMSG.MEMORY_OP_MSG.value +
+                  '{} bytes'.format(dqn.memory.nbytes))
+    elif trainOrTest == MYSTR.TEST.value:
+        import logger
+
+        if eval_workers > 0:
+            import evaluate
+
+            results = evaluate.evaluate(
+                env_name, env_kwargs or {}, model_factory(env_name),
+                weights_path, episodes, eval_workers, seed=MYSTR.SEED.value,
+                window_length=dqn.memory.window_length, max_steps=max_steps,
+                numpy_inference=dqn.numpy_model is not None)
+            print_results(results, env.action_space.n, log_mode)
+            return
+        dqn.load_weights(weights_path)
+        if log_mode == 'aggregate':
+            cb_ep = logger.AggregateEpisodeLogger(window=episodes)
+        elif episode_log is None:
+            cb_ep = logger.EpisodeLogger()
+        else:
+            cb_ep = logger.StreamingEpisodeLogger(episode_log)
+        dqn.test(env, nb_episodes=episodes, visualize=False,
+                 callbacks=[cb_ep, create_render_policy(
+                     render, render_every, frames_path)] +
+                 extra_callbacks)
+        if log_mode == 'aggregate':
+            print(OUTMSG.OUTPUT_HEADER.value + OUTMSG.SUMMARY_OP_MSG.value)
+            print(cb_ep.table())
+            return
+        if episode_log is None:
+            ep_acs = cb_ep.actions.values()
+        else:
+            ep_acs = (ep['action'].tolist()
+                      for _, ep in logger.EpisodeReader(episode_log))
+        for index, ep_ac in enumerate(ep_acs):
+            print(OUTMSG.OUTPUT_HEADER.value +
+                  'episode_{}:'.format(index) +
+                  OUTMSG.ACTIONS_OP_MSG.value +
+                  str(ep_ac))
+    elif trainOrTest == MYSTR.ORACLE.value:
+        import numpy as np
+        from myenv import planning
+
+        dqn.load_weights(weights_path)
+        model = planning.GridModel.from_env(env)
+        optimal, optimal_policy = planning.value_iteration(model, dqn.gamma)
+        observations = planning.cell_observations(env)
+        states = np.repeat(observations[:, None],
+                           dqn.memory.window_length, axis=1)
+        policy = planning.policy_from_q(dqn.compute_batch_q_values(states))
+        result = planning.score(model, policy, dqn.gamma, optimal)
+        print(OUTMSG.OUTPUT_HEADER.value + OUTMSG.ORACLE_OP_MSG.value +
+              '{value:.2f} / {optimal:.2f} / {gap:.2f}'.format(**result))
+        print(model.policy_map(model.cell_policy(policy)))
+        print()
+        print(model.policy_map(optimal_policy))
+    elif trainOrTest == MYSTR.EXPORT.value:
+        import inference
+
+        dqn.load_weights(weights_path)
+        frozen_path = frozen_path or 'policy_{}.npz'.format(env_name)
+        inference.DenseNet.from_model(dqn.model).save(
+            frozen_path, env=env_name, env_kwargs=env_kwargs or {},
+            window_length=dqn.memory.window_length)
+        print(OUTMSG.OUTPUT_HEADER.value + OUTMSG.EXPORT_OP_MSG.value +
+              frozen_path)
+    else:
+        raise TypeError(ERRMSG.ERROR_HEADER.value +
+                        ERRMSG.EXEC_ERROR.value)
+
+
+def print_results(results, nb_actions, log_mode):
+    """evaluate.evaluateの結果を表かepisode毎のactionにして出す"""
+    import evaluate
+
+    if log_mode == 'aggregate':
+        print(OUTMSG.OUTPUT_HEADER.value + OUTMSG.SUMMARY_OP_MSG.value)
+        print(evaluate.summarize(results, nb_actions).table())
+        return
+    for result in results:
+        print(OUTMSG.OUTPUT_HEADER.value +
+              'episode_{}:'.format(result['episode']) +
+              OUTMSG.ACTIONS_OP_MSG.value +
+              str(result['actions']))
+
+
+def test_frozen(args):
+    """EXPORTしたpolicyでTESTする. keras/TensorFlowは読み込まない"""
+    import evaluate
+    import inference
+
+    policy = inference.load(args.frozen_policy)
+    env_name = policy.meta.get('env', args.env)
+    results = evaluate.evaluate(
+        env_name, policy.meta.get('env_kwargs', {}), None,
+        args.frozen_policy, args.nb_episodes, args.eval_workers,
+        seed=MYSTR.SEED.value, window_length=policy.window_length,
+        max_steps=args.max_steps)
+    print_results(results, policy.nb_actions, args.log_mode)
+
+
+def check_args(args):
+    """一緒には使えないオプションの組み合わせならエラーの文言を返す"""
+    if args.actors > 0 and (args.memory in ('prioritized', 'symmetric') or
+                            args.memory_dir is not None):
+        return ERRMSG.ACTORS_MEMORY_ERROR.value
+    if args.memory_dir is not None and args.memory not in STORED_MEMORIES:
+        return ERRMSG.MEMORY_DIR_ERROR.value
+    if args.actors > 0 and (args.checkpoint_interval > 0 or args.resume):
+        return ERRMSG.ACTORS_CHECKPOINT_ERROR.value
+    if args.actors > 0 and (args.render not in (None, 'off') or
+                            args.profile):
+        return ERRMSG.ACTORS_CALLBACK_ERROR.value
+    return None
+
+
+def main(argv=None):
+    parser = myperser()
+    args = parser.parse_args(argv)
+    error = check_args(args)
+    if error is not None:
+        parser.error(ERRMSG.ERROR_HEADER.value + error)
+    if args.render is None:
+        args.render = 'off' if args.actors > 0 else 'step'
+    if args.exec_type == MYSTR.SWEEP.value:
+        import sweep
+
+        sweep.run(args.sweep_spec, args, args.env, create_dqn,
+                  args.sweep_out, args.sweep_workers, args.sweep_threads,
+                  seed=MYSTR.SEED.value)
+        return
+    if args.exec_type == MYSTR.TEST.value and args.frozen_policy:
+        test_frozen(args)
+        return
+
+    import numpy as np
+    import myenv
+
+    env_kwargs = env_kwargs_of(args)
+    env = myenv.make(args.env, **env_kwargs)
+    np.random.seed(MYSTR.SEED.value)
+    env.seed(MYSTR.SEED.value)
+    if args.exec_type == MYSTR.ORACLE.value:
+        from myenv import planning
+
+        if not planning.supports(env):
+            parser.error(ERRMSG.ERROR_HEADER.value +
+                         ERRMSG.ORACLE_ENV_ERROR.value)
+
+    dqn = create_dqn(args, env)
+    print(dqn.model.summary())
+
+    profile = None
+    if args.profile:
+        import profiler
+
+        profile = profiler.ProfilerCallback(
+            profiler.Profiler(), args.profile_interval,
+            args.profile_trace or 'profile_{}.json'.format(args.env),
+            args.trace_start, args.trace_steps)
+        env = profiler.instrument(dqn, env, profile.profiler)
+
+    exec_dqn(args.exec_type, env, dqn,
+             args.nb_steps, args.verbose, args.nb_episodes,
+             episode_log=args.episode_log, log_mode=args.log_mode,
+             actors=args.actors, env_kwargs=env_kwargs,
+             eval_workers=args.eval_workers, max_steps=args.max_steps,
+             env_name=args.env, render=args.render,
+             render_every=args.render_every, frames_path=args.frames,
+             profile=profile, checkpoint_interval=args.checkpoint_interval,
+             checkpoint_dir=args.checkpoint_dir,
+             checkpoint_keep=args.checkpoint_keep, resume=args.resume,
+             frozen_path=args.frozen_policy)
+    if dqn.q_cache is not None:
+        print(OUTMSG.OUTPUT_HEADER.value + OUTMSG.QCACHE_OP_MSG.value +
+              '{:.1%} ({} hits, {} misses, {} clears)'.format(
+                  dqn.q_cache.hit_rate, dqn.q_cache.hits,
+                  dqn.q_cache.misses, dqn.q_cache.clears))
+
+
+if __name__ == '__main__':
+    main()
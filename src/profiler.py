@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""学習ループのどこに時間がかかっているかをphase毎に測る
+
+instrumentでenvとDQNAgentの次の所にタイマーを付ける.
+
+    env.step, env.reset          : envの1step, reset
+    predict                      : 行動選択のQ値計算(compute_q_values)
+    append                       : replay memoryへの追加
+    sample                       : minibatchを引く(sample_batch)
+    train                        : trainable_model.train_on_batch
+
+ProfilerCallbackはstep全体も測り、phaseに入らない残りをotherとして
+interval step毎に表を出す. trace_startから trace_steps step分は
+Chrome trace-event形式のJSONにも書き出す(chrome://tracing で開ける).
+"""
+
+import json
+from time import perf_counter
+
+import gym
+import numpy as np
+import rl.callbacks
+
+PERCENTILES = (50, 95, 99)
+
+
+class Profiler(object):
+    """phase毎の合計時間と、直近window回分の所要時間を持つ"""
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.totals = {}
+        self.counts = {}
+        self.recent = {}
+        self.tracing = False
+        self.events = []
+        self.origin = perf_counter()
+
+    def add(self, phase, start, end):
+        duration = end - start
+        count = self.counts.get(phase)
+        if count is None:
+            count = self.counts[phase] = 0
+            self.totals[phase] = 0.
+            self.recent[phase] = np.zeros(self.window)
+        self.recent[phase][count % self.window] = duration
+        self.counts[phase] = count + 1
+        self.totals[phase] += duration
+        if self.tracing:
+            self.events.append((phase, start, duration))
+
+    def timed(self, phase, func):
+        """funcを呼ぶ度にphaseとして時間を測る関数を返す"""
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, start, perf_counter())
+        return wrapper
+
+    def wrap(self, obj, name, phase):
+        """obj.nameをtimedで包んだものに差し替える"""
+        setattr(obj, name, self.timed(phase, getattr(obj, name)))
+
+    def stats(self):
+        """{phase: {'total', 'count', 'mean', 'p50', 'p95', 'p99'}} (秒)"""
+        stats = {}
+        for phase, count in self.counts.items():
+            recent = self.recent[phase][:min(count, self.window)]
+            stats[phase] = {'total': self.totals[phase], 'count': count,
+                            'mean': self.totals[phase] / count}
+            for q in PERCENTILES:
+                stats[phase]['p{}'.format(q)] = np.percentile(recent, q)
+        return stats
+
+    def table(self):
+        """statsを表の文字列にする. stepがあれば残りをotherとして足す"""
+        stats = self.stats()
+        step_total = stats.get('step', {}).get('total', 0.)
+        if step_total:
+            other = step_total - sum(
+                phase['total'] for name, phase in stats.items()
+                if name not in ('step', 'env.reset'))
+            stats['other'] = {'total': other,
+                              'count': stats['step']['count']}
+        columns = ['mean'] + ['p{}'.format(q) for q in PERCENTILES]
+        lines = ['{:10s}{:>10s}{:>8s}'.format('phase', 'total s', 'share') +
+                 ''.join('{:>10s}'.format(c + ' us') for c in columns) +
+                 '{:>10s}'.format('count')]
+        for name in sorted(stats, key=lambda name: -stats[name]['total']):
+            phase = stats[name]
+            share = phase['total'] / step_total if step_total else np.nan
+            lines.append(
+                '{:10s}{:10.3f}{:8.1%}'.format(name, phase['total'], share) +
+                ''.join('{:10.1f}'.format(phase[c] * 1e6) if c in phase
+                        else '{:>10s}'.format('-') for c in columns) +
+                '{:10d}'.format(phase['count']))
+        return '\n'.join(lines)
+
+    def save_trace(self, path):
+        """記録したphaseをChrome trace-event形式のJSONに書く"""
+        events = [{'name': phase, 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': (start - self.origin) * 1e6,
+                   'dur': duration * 1e6}
+                  for phase, start, duration in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms'}, f)
+
+
+class ProfiledEnv(gym.Wrapper):
+    """env.step と env.reset の時間を測る"""
+
+    def __init__(self, env, profiler):
+        super().__init__(env)
+        self.profiler = profiler
+
+    def step(self, action):
+        start = perf_counter()
+        result = self.env.step(action)
+        self.profiler.add('env.step', start, perf_counter())
+        return result
+
+    def reset(self, **kwargs):
+        start = perf_counter()
+        observation = self.env.reset(**kwargs)
+        self.profiler.add('env.reset', start, perf_counter())
+        return observation
+
+
+class ProfilerCallback(rl.callbacks.Callback):
+    """step全体を測り、interval step毎に表を出し、traceを書き出す"""
+
+    def __init__(self, profiler, interval=10000, trace_path=None,
+                 trace_start=1000, trace_steps=200):
+        self.profiler = profiler
+        self.interval = interval
+        self.trace_path = trace_path
+        self.trace_start = trace_start
+        self.trace_end = trace_start + trace_steps
+        self.nb_steps = 0
+        self.step_start = None
+        self.interval_start = None
+
+    def on_train_begin(self, logs):
+        self.interval_start = perf_counter()
+
+    def on_step_begin(self, step, logs):
+        if self.trace_path is not None:
+            if self.nb_steps == self.trace_start:
+                self.profiler.tracing = True
+            elif self.nb_steps == self.trace_end:
+                self.stop_trace()
+        self.step_start = perf_counter()
+
+    def on_step_end(self, step, logs):
+        self.profiler.add('step', self.step_start, perf_counter())
+        self.nb_steps += 1
+        if self.nb_steps % self.interval == 0:
+            self.report()
+
+    def on_train_end(self, logs):
+        if self.nb_steps % self.interval:
+            self.report()
+        self.stop_trace()
+
+    def report(self):
+        now = perf_counter()
+        steps = self.nb_steps % self.interval or self.interval
+        print('profile: {} steps, {:.1f} steps/s (last {} steps)'.format(
+            self.nb_steps, steps / (now - self.interval_start), steps))
+        print(self.profiler.table())
+        self.interval_start = perf_counter()
+
+    def stop_trace(self):
+        if self.profiler.tracing:
+            self.profiler.tracing = False
+            self.profiler.save_trace(self.trace_path)
+            print('profile: trace of steps {}-{} written to {}'.format(
+                self.trace_start, self.nb_steps, self.trace_path))
+
+
+def instrument(dqn, env, profiler):
+    """dqnの行動選択/memory/学習にタイマーを付け、envを包んで返す"""
+    profiler.wrap(dqn, 'compute_q_values', 'predict')
+    profiler.wrap(dqn.memory, 'append', 'append')
+    if hasattr(dqn, 'sample_batch'):
+        profiler.wrap(dqn, 'sample_batch', 'sample')
+    else:
+        profiler.wrap(dqn.memory, 'sample', 'sample')
+    profiler.wrap(dqn.trainable_model, 'train_on_batch', 'train')
+    return ProfiledEnv(env, profiler)
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+from rl.memory import Memory, Experience
+
+
+class MemmapStorage(object):
+    """replay memoryの配列を.npyのnumpy.memmapに置き、別threadでflushする
+
+    配列の中身と一緒に書き込み位置などをmeta.jsonに残すので、
+    同じdirectoryを渡せば次の実行で続きから使える.
+    """
+    META = 'meta.json'
+
+    def __init__(self, directory, flush_interval=10000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.arrays = {}
+        os.makedirs(directory, exist_ok=True)
+        self.meta = None
+        path = os.path.join(directory, self.META)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+        # flush待ちは1つだけ. 前のflushが終わっていなければ今回は見送る
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+
+    def array(self, name, shape, dtype):
+        """ファイルがあり形と型が同じなら開き直し、なければ作る"""
+        path = os.path.join(self.directory, name + '.npy')
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if os.path.exists(path):
+            array = np.lib.format.open_memmap(path, mode='r+')
+            if array.shape == shape and array.dtype == dtype:
+                self.arrays[name] = array
+                return array
+            del array
+        array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                          shape=shape)
+        self.arrays[name] = array
+        return array
+
+    def flush(self, meta, wait=False):
+        """配列とmetaの書き出しをflush用のthreadに頼む"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        if wait:
+            self._queue.put(meta)
+            self._queue.join()
+            return
+        try:
+            self._queue.put_nowait(meta)
+        except queue.Full:
+            pass
+
+    def close(self, meta):
+        self.flush(meta, wait=True)
+
+    def _run(self):
+        while True:
+            meta = self._queue.get()
+            try:
+                for array in list(self.arrays.values()):
+                    array.flush()
+                # metaは中身を書いた後に一時ファイルから置き換える
+                path = os.path.join(self.directory, self.META)
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(meta, f)
+                os.replace(path + '.tmp', path)
+                self.meta = meta
+            finally:
+                self._queue.task_done()
+
+
+class RingMemory(Memory):
+    """SequentialMemoryと同じ使い方で、型付きの配列に直接書き込むreplay memory
+
+    obs/action/reward/terminalは確保済みのリングバッファに入り、
+    sampleは添字の生成からwindowの組み立てまでnumpyでまとめて行う.
+    添字の意味(terminals[i]はobservations[i]からの遷移の終端か)は
+    SequentialMemoryと同じ.
+    storageにMemmapStorageを渡すと配列をファイルに置き、前回の続きから始める.
+    """
+
+    def __init__(self, limit, storage=None, **kwargs):
+        super().__init__(**kwargs)
+        self.limit = limit
+        self.storage = storage
+        self.index = 0
+        self.count = 0
+        self.nb_appended = 0
+        self.observations = None
+        self.actions = self._array('actions', (limit,), np.int32)
+        self.rewards = self._array('rewards', (limit,), np.float32)
+        self.terminals = self._array('terminals', (limit,), bool)
+        self._offsets = np.arange(-(self.window_length - 1), 2)
+        if storage is not None and storage.meta is not None and \
+           storage.meta['limit'] == limit and storage.meta['count'] > 0:
+            self._resume(storage.meta)
+
+    @property
+    def nb_entries(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        """保持している配列の合計バイト数"""
+        nbytes = (self.actions.nbytes + self.rewards.nbytes
+                  + self.terminals.nbytes)
+        if self.observations is not None:
+            nbytes += self.observations.nbytes
+        return nbytes
+
+    def append(self, observation, action, reward, terminal, training=True):
+        super().append(observation, action, reward, terminal,
+                       training=training)
+        if not training:
+            return
+        if self.observations is None:
+            observation = np.asarray(observation)
+            self.observations = self._array(
+                'observations', (self.limit,) + observation.shape,
+                observation.dtype)
+        self.observations[self.index] = observation
+        self.actions[self.index] = action
+        self.rewards[self.index] = reward
+        self.terminals[self.index] = terminal
+        self.index = (self.index + 1) % self.limit
+        self.count = min(self.count + 1, self.limit)
+        self.nb_appended += 1
+        if self.storage is not None and \
+           self.nb_appended % self.storage.flush_interval == 0:
+            self.storage.flush(self.state())
+
+    def extend(self, observations, actions, rewards, terminals):
+        """複数の遷移をまとめて書き込む(appendをn回するのと同じ)"""
+        n = len(actions)
+        if n == 0:
+            return
+        if self.observations is None:
+            self.observations = self._array(
+                'observations',
+                (self.limit,) + np.shape(observations)[1:],
+                np.asarray(observations).dtype)
+        for observation, terminal in zip(observations[-self.window_length:],
+                                         terminals[-self.window_length:]):
+            self.recent_observations.append(observation)
+            self.recent_terminals.append(terminal)
+        if n > self.limit:
+            skip = n - self.limit
+            self.index = (self.index + skip) % self.limit
+            self.nb_appended += skip
+            observations, actions = observations[skip:], actions[skip:]
+            rewards, terminals = rewards[skip:], terminals[skip:]
+            n = self.limit
+        slots = (self.index + np.arange(n)) % self.limit
+        self.observations[slots] = observations
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.terminals[slots] = terminals
+        self.index = (self.index + n) % self.limit
+        self.count = min(self.count + n, self.limit)
+        flushed = self.nb_appended
+        self.nb_appended += n
+        if self.storage is not None and \
+           flushed // self.storage.flush_interval != \
+           self.nb_appended // self.storage.flush_interval:
+            self.storage.flush(self.state())
+
+    def state(self):
+        """storageに残す書き込み位置と観測の形"""
+        return {
+            'limit': self.limit,
+            'index': self.index,
+            'count': self.count,
+            'observation_shape': (None if self.observations is None
+                                  else list(self.observations.shape[1:])),
+            'observation_dtype': (None if self.observations is None
+                                  else self.observations.dtype.str),
+        }
+
+    def close(self):
+        """storageがあれば最後まで書き出す"""
+        if self.storage is not None:
+            self.storage.close(self.state())
+
+    def sample_indexes(self, batch_size):
+        """state0にできる論理添字(古い順に0..)をまとめて引く"""
+        return (self._sample_positions(batch_size) - self._start()) % \
+            self.limit
+
+    def _sample_positions(self, batch_size):
+        """sample_indexesと同じものをリングバッファ上の位置で返す
+
+        1つ前の遷移が終端の添字(次のepisodeの先頭をまたぐもの)は捨てる.
+        捨てる分を見越して多めに引き、足りない時だけ引き直す.
+        """
+        positions = self._draw(2 * batch_size)
+        while len(positions) < batch_size:
+            positions = np.concatenate([positions,
+                                        self._draw(2 * batch_size)])
+        return positions[:batch_size]
+
+    def _draw(self, size):
+        """論理添字 [window_length, count-1) をsize個引いて位置にする"""
+        positions = np.random.random_sample(size)
+        positions *= self.count - 1 - self.window_length
+        positions = positions.astype(np.int64)
+        positions += self._start() + self.window_length
+        positions %= self.limit
+        # 直前の位置が-1になるのは配列の最後(折り返した先)なのでそのまま引く
+        return positions[~self.terminals[positions - 1]]
+
+    def sample_batch(self, batch_size, batch_idxs=None):
+        """配列のまま (state0, action, reward, state1, terminal1) を返す
+
+        学習の度に呼ばれるので、小さい配列の演算の回数を減らしてある
+        (添字は最初からリングバッファ上の位置で引き、後は普通の添字で引く).
+        """
+        assert self.count >= self.window_length + 2, \
+            'not enough entries in the memory'
+        if batch_idxs is None:
+            physical = self._sample_positions(batch_size)
+        else:
+            physical = np.add(batch_idxs, self._start())
+            physical %= self.limit
+
+        # 論理添字 i-(W-1) .. i+1 を1回で集め、state0とstate1はそのview.
+        # i+1等はlimitを越えることがあるので、takeのmode='wrap'で折り返す
+        window = self.observations.take(physical[:, None] + self._offsets,
+                                        axis=0, mode='wrap')
+        if self.window_length > 1 and not self.ignore_episode_boundaries:
+            # i-m 番目を入れるのは i-2 .. i-1-m の間に終端が無い時だけ
+            back = np.arange(1, self.window_length)
+            ended = np.take(self.terminals, physical[:, None] - 1 - back,
+                            mode='wrap')
+            ended = np.logical_or.accumulate(ended, axis=1)[:, ::-1]
+            window[:, :-2][ended] = 0
+        state0, state1 = window[:, :-1], window[:, 1:]
+
+        return (state0, self.actions[physical], self.rewards[physical],
+                state1, self.terminals[physical])
+
+    def sample(self, batch_size, batch_idxs=None):
+        """DQNAgentが使うExperienceのリストとして返す"""
+        state0, actions, rewards, state1, terminal1 = self.sample_batch(
+            batch_size, batch_idxs)
+        return list(map(Experience, state0, actions.tolist(),
+                        rewards.tolist(), state1, terminal1.tolist()))
+
+    def get_config(self):
+        config = super().get_config()
+        config['limit'] = self.limit
+        return config
+
+    def _array(self, name, shape, dtype):
+        if self.storage is None:
+            return np.zeros(shape, dtype=dtype)
+        return self.storage.array(name, shape, dtype)
+
+    def _resume(self, meta):
+        """前回の実行で書いた配列を続きから使う"""
+        self.observations = self._array(
+            'observations',
+            (self.limit,) + tuple(meta['observation_shape']),
+            meta['observation_dtype'])
+        self.index = meta['index']
+        self.count = meta['count']
+        # 最後の遷移の次の観測は残っていないので、そこで終端したことにする
+        self.terminals[self._physical(self.count - 1)] = True
+        if self.count == self.limit:
+            # metaを書いた後もmemmapには書き続けているので、indexの先の
+            # 何スロットかはmetaより新しい遷移で上書きされているかもしれない.
+            # 新旧の継ぎ目をまたがないよう、その範囲も終端にしておく.
+            # flushは1つ見送られることがあるので、metaは最大2回分古い
+            dirty = min(2 * self.storage.flush_interval, self.limit)
+            self.terminals[(self.index + np.arange(dirty)) % self.limit] = \
+                True
+
+    def _start(self):
+        """論理添字0(一番古いもの)のリングバッファ上の位置"""
+        return self.index if self.count == self.limit else 0
+
+    def _physical(self, idxs):
+        """論理添字(古い順)をリングバッファ上の位置に変換する"""
+        return (self._start() + idxs) % self.limit
+
+
+class SumTree(object):
+    """葉に優先度、内部ノードに子の和を持つ配列の二分木
+
+    tree[1]が根で、tree[i]の子はtree[2i]とtree[2i+1].
+    更新も探索も木の高さ分(O(log n))を、まとめて渡した添字について一度に行う.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    @property
+    def nbytes(self):
+        return self.tree.nbytes
+
+    def get(self, idxs):
+        return self.tree[np.asarray(idxs) + self.leaves]
+
+    def update(self, idxs, priorities):
+        """葉を書き換え、親を根までたどって和を付け直す"""
+        nodes = np.asarray(idxs, dtype=np.int64) + self.leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            # 重複した親は同じ和を書くだけなので、まとめずにそのまま書く
+            nodes //= 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """累積和がvaluesに達する葉の添字を返す"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.tree[2 * nodes]
+            right = values >= left
+            values -= left * right
+            nodes = 2 * nodes + right
+        # 浮動小数の誤差で優先度0の葉に落ちた時は左の葉に寄せる
+        return np.minimum(nodes - self.leaves, self.capacity - 1)
+
+
+class PrioritizedMemory(RingMemory):
+    """TD誤差に比例した確率で引くreplay memory (proportional PER)
+
+    優先度はSumTreeの葉に、リングバッファと同じ位置で持つ.
+    まだ次の観測が無い最新の遷移と、episodeの先頭をまたぐ遷移は優先度0にして
+    引かれないようにする. 重要度重みはbatch内の最大値で正規化する.
+    """
+
+    def __init__(self, limit, alpha=0.6, beta=0.4, beta_steps=100000,
+                 epsilon=1e-6, **kwargs):
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_steps = beta_steps
+        self.epsilon = epsilon
+        self.priorities = SumTree(limit)
+        self.max_priority = 1.
+        self.nb_samples = 0
+        super().__init__(limit, **kwargs)
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.priorities.nbytes
+
+    def _resume(self, meta):
+        """優先度は残していないので、引ける遷移を全て同じ優先度で始める"""
+        super()._resume(meta)
+        logical = np.arange(self.window_length, self.count - 1)
+        logical = logical[~self.terminals[self._physical(logical - 1)]]
+        self.priorities.update(self._physical(logical),
+                               np.full(len(logical), self.max_priority))
+
+    def append(self, observation, action, reward, terminal, training=True):
+        if not training:
+            return super().append(observation, action, reward, terminal,
+                                  training=training)
+        written = self.index
+        super().append(observation, action, reward, terminal,
+                       training=training)
+        idxs = [written]
+        priorities = [0.]
+        # 1つ前の遷移はこれで次の観測がそろったので引けるようになる
+        previous = self.count - 2
+        if previous >= self.window_length and \
+           not self.terminals[self._physical(previous - 1)]:
+            idxs.append(self._physical(previous))
+            priorities.append(self.max_priority ** self.alpha)
+        # 満杯の時は一番古いwindow分が足りなくなるので外す
+        if self.count == self.limit:
+            idxs.append(self._physical(self.window_length - 1))
+            priorities.append(0.)
+        self.priorities.update(idxs, priorities)
+
+    def sample_prioritized(self, batch_size):
+        """(state0, action, reward, state1, terminal1, 重み, 位置) を返す"""
+        assert self.priorities.total > 0, 'not enough entries in the memory'
+        # 区間を batch_size 等分し、それぞれから1つずつ引く
+        segment = self.priorities.total / batch_size
+        values = (np.arange(batch_size)
+                  + np.random.random_sample(batch_size)) * segment
+        physical = self.priorities.find(values)
+        # 誤差で優先度0の葉に落ちたものは一様に引き直す
+        zero = self.priorities.get(physical) <= 0.
+        if zero.any():
+            physical[zero] = self._physical(self.sample_indexes(zero.sum()))
+        batch = self.sample_batch(
+            batch_size, (physical - self._start()) % self.limit)
+
+        beta = min(1., self.beta + (1. - self.beta)
+                   * self.nb_samples / self.beta_steps)
+        self.nb_samples += 1
+        probs = self.priorities.get(physical) / self.priorities.total
+        weights = (self.count * probs) ** -beta
+        weights /= weights.max()
+        return batch + (weights.astype(np.float32), physical)
+
+    def update_priorities(self, physical, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.priorities.update(physical, priorities ** self.alpha)
+
+    def get_config(self):
+        config = super().get_config()
+        config['alpha'] = self.alpha
+        config['beta'] = self.beta
+        config['beta_steps'] = self.beta_steps
+        return config
+
+
+class ShardedMemory(Memory):
+    """遷移の列ごとに別のRingMemory(shard)に入れておき、まとめて引く
+
+    actorが複数ある時のように、互いに続いていない遷移の列を1つのリングに
+    混ぜると次の観測がずれるので、列ごとにshardを分ける.
+    batchは各shardの件数に比例して割り振る.
+    """
+
+    def __init__(self, shards):
+        super().__init__(window_length=shards[0].window_length,
+                         ignore_episode_boundaries=shards[0]
+                         .ignore_episode_boundaries)
+        self.shards = shards
+
+    @property
+    def limit(self):
+        return sum(shard.limit for shard in self.shards)
+
+    @property
+    def nb_entries(self):
+        return sum(shard.nb_entries for shard in self.shards)
+
+    @property
+    def nbytes(self):
+        return sum(shard.nbytes for shard in self.shards)
+
+    def append(self, observation, action, reward, terminal, training=True):
+        super().append(observation, action, reward, terminal,
+                       training=training)
+        self.shards[0].append(observation, action, reward, terminal,
+                              training=training)
+
+    def sample_batch(self, batch_size, batch_idxs=None):
+        ready = [shard for shard in self.shards
+                 if shard.nb_entries >= self.window_length + 2]
+        assert ready, 'not enough entries in the memory'
+        sizes = np.array([shard.nb_entries for shard in ready],
+                         dtype=np.float64)
+        counts = np.random.multinomial(batch_size, sizes / sizes.sum())
+        parts = [shard.sample_batch(count)
+                 for shard, count in zip(ready, counts) if count > 0]
+        return tuple(np.concatenate(field) for field in zip(*parts))
+
+    def sample(self, batch_size, batch_idxs=None):
+        state0, actions, rewards, state1, terminal1 = self.sample_batch(
+            batch_size)
+        return list(map(Experience, state0, actions.tolist(),
+                        rewards.tolist(), state1, terminal1.tolist()))
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+class SymmetryAugmentedMemory(ShardedMemory):
+    """1つの遷移を、盤の対称変換を掛けた形でも全てのshardに入れる
+
+    transformsは (観測, action) -> (観測, action) の関数のリスト
+    (envAd.MyEnv.symmetry_transforms). shard k には変換kを掛けた遷移の列が
+    入るので、次の観測もずれない. 大きさは limit を変換の数で等分する.
+    """
+
+    def __init__(self, limit, transforms, **kwargs):
+        super().__init__([RingMemory(limit // len(transforms), **kwargs)
+                          for _ in transforms])
+        self.transforms = transforms
+
+    def append(self, observation, action, reward, terminal, training=True):
+        Memory.append(self, observation, action, reward, terminal,
+                      training=training)
+        if not training:
+            return
+        for shard, transform in zip(self.shards, self.transforms):
+            shard_observation, shard_action = transform(observation, action)
+            shard.append(shard_observation, shard_action, reward, terminal,
+                         training=training)
+
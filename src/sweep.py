@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""CLIのオプションを振って学習を並列に走らせ、結果を表にする
+
+specはJSONで、gridかrandomのどちらかを書く. キーはCLIのオプション名
+(learning_rate, target_model_update, window_length, warmup, limit,
+nb_steps など、argparseの属性名).
+
+    {"grid": {"learning_rate": [1e-3, 1e-4], "window_length": [1, 2]}}
+
+    {"random": {"learning_rate": {"log_uniform": [1e-4, 1e-2]},
+                "target_model_update": {"uniform": [1e-3, 1e-1]},
+                "warmup": {"int": [10, 1000]},
+                "limit": [10000, 50000]},
+     "trials": 20, "seed": 0}
+
+"early_stop": {"min_steps": 5000, "interval": 1000, "window": 10,
+"percentile": 50, "min_trials": 3} で打ち切りの条件を変えられる.
+interval step毎に直近window episodeの平均報酬を記録し、同じstepで
+min_trials個以上の他のtrialが記録していて、その percentile 未満なら止める.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import get_context
+
+import gym.spaces
+import numpy as np
+import rl.callbacks
+
+import apex
+import myenv
+
+EARLY_STOP = {'min_steps': 5000, 'interval': 1000, 'window': 10,
+              'percentile': 50, 'min_trials': 3}
+
+
+class EarlyStop(Exception):
+    pass
+
+
+def _draw(random, space):
+    if isinstance(space, list):
+        return space[random.randint(len(space))]
+    (kind, (low, high)), = space.items()
+    if kind == 'uniform':
+        return float(random.uniform(low, high))
+    if kind == 'log_uniform':
+        return float(np.exp(random.uniform(np.log(low), np.log(high))))
+    if kind == 'int':
+        return int(random.randint(low, high + 1))
+    raise ValueError('unknown distribution: {}'.format(kind))
+
+
+def trials(spec):
+    """specからtrial毎の {オプション名: 値} のリストを作る"""
+    if 'grid' in spec:
+        names = sorted(spec['grid'])
+        return [dict(zip(names, values)) for values in itertools.product(
+            *(spec['grid'][name] for name in names))]
+    if 'random' in spec:
+        random = np.random.RandomState(spec.get('seed', 0))
+        names = sorted(spec['random'])
+        return [{name: _draw(random, spec['random'][name]) for name in names}
+                for _ in range(spec['trials'])]
+    raise ValueError('spec needs "grid" or "random"')
+
+
+class MedianStopping(rl.callbacks.Callback):
+    """interval step毎に直近の平均報酬をboardに書き、他のtrialより
+    明らかに悪ければEarlyStopを投げる"""
+
+    def __init__(self, board, trial, min_steps=5000, interval=1000,
+                 window=10, percentile=50, min_trials=3):
+        self.board = board
+        self.trial = trial
+        self.min_steps = min_steps
+        self.interval = interval
+        self.percentile = percentile
+        self.min_trials = min_trials
+        self.rewards = deque(maxlen=window)
+        self.nb_steps = 0
+        self.nb_episodes = 0
+
+    def on_episode_end(self, episode, logs):
+        self.nb_episodes += 1
+        self.rewards.append(logs['episode_reward'])
+
+    def on_step_end(self, step, logs):
+        self.nb_steps += 1
+        if self.nb_steps % self.interval or not self.rewards:
+            return
+        running = float(np.mean(self.rewards))
+        self.board.append((self.trial, self.nb_steps, running))
+        if self.nb_steps < self.min_steps:
+            return
+        others = [value for trial, steps, value in list(self.board)
+                  if steps == self.nb_steps and trial != self.trial]
+        if len(others) >= self.min_trials and \
+           running < np.percentile(others, self.percentile):
+            raise EarlyStop()
+
+
+def run_trial(build, env_name, args, trial, params, board, early_stop,
+              seed):
+    """1つのtrialを学習し、結果の1行をdictで返す"""
+    import myenv_dqn
+
+    start = time.time()
+    args = argparse.Namespace(**dict(vars(args), **params))
+    env = myenv.make(env_name, **myenv_dqn.env_kwargs_of(args))
+    np.random.seed(seed)
+    gym.spaces.prng.seed(seed)
+    env.seed(seed)
+    dqn = build(args, env)
+
+    stopper = MedianStopping(board, trial, **early_stop)
+    status = 'done'
+    fit_start = time.time()
+    try:
+        dqn.fit(env, nb_steps=args.nb_steps, visualize=False, verbose=0,
+                callbacks=[stopper])
+    except EarlyStop:
+        status = 'stopped'
+    fit_seconds = time.time() - fit_start
+    return dict(params, trial=trial, status=status,
+                nb_steps=stopper.nb_steps, nb_episodes=stopper.nb_episodes,
+                mean_reward=(float(np.mean(stopper.rewards))
+                             if stopper.rewards else np.nan),
+                wall_time=time.time() - start,
+                steps_per_sec=stopper.nb_steps / fit_seconds)
+
+
+def write_results(rows, out):
+    """out.csv と out.json に書く"""
+    columns = ['trial'] + sorted(
+        {key for row in rows for key in row} -
+        {'trial', 'status', 'nb_steps', 'nb_episodes', 'mean_reward',
+         'wall_time', 'steps_per_sec'}) + \
+        ['status', 'nb_steps', 'nb_episodes', 'mean_reward', 'wall_time',
+         'steps_per_sec']
+    with open(out + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(out + '.json', 'w') as f:
+        json.dump(rows, f, indent=2)
+    return columns
+
+
+def run(spec_path, args, env_name, build, out, workers=0, threads=1,
+        seed=123):
+    """specの全trialをworkers個のプロセスで走らせ、平均報酬の良い順の
+    結果を返す. 各trialのBLAS/TensorFlowのスレッドはthreads本まで"""
+    with open(spec_path) as f:
+        spec = json.load(f)
+    configs = trials(spec)
+    unknown = {name for params in configs for name in params} - \
+        set(vars(args))
+    if unknown:
+        raise ValueError('unknown options: {}'.format(sorted(unknown)))
+    early_stop = dict(EARLY_STOP, **spec.get('early_stop', {}))
+    if workers <= 0:
+        workers = max((os.cpu_count() or 1) // threads, 1)
+
+    context = get_context('spawn')
+    with context.Manager() as manager, apex.thread_limit(threads):
+        board = manager.list()
+        with context.Pool(workers, maxtasksperchild=1) as pool:
+            pending = [pool.apply_async(
+                run_trial, (build, env_name, args, trial, params, board,
+                            early_stop, seed))
+                for trial, params in enumerate(configs)]
+            rows = [result.get() for result in pending]
+
+    rows.sort(key=lambda row: -np.nan_to_num(row['mean_reward'],
+                                             nan=-np.inf))
+    columns = write_results(rows, out)
+    print(' '.join('{:>14s}'.format(column[:14]) for column in columns))
+    for row in rows:
+        print(' '.join('{:>14.6g}'.format(row[column])
+                       if isinstance(row[column], (int, float))
+                       else '{:>14s}'.format(str(row[column]))
+                       for column in columns))
+    return rows
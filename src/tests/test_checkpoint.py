@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""checkpointのsnapshot/restoreでoptimizerの状態が戻るか
+
+    cd src && python -m pytest -q tests
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+import checkpoint  # noqa: E402
+import myenv  # noqa: E402
+import myenv_dqn  # noqa: E402
+
+
+def make_dqn(env):
+    # 既定の -u 1e-2 ではoptimizerがAdditionalUpdatesOptimizerに包まれる
+    args = myenv_dqn.myperser().parse_args(['-wu', '10', '-l', '1000'])
+    return myenv_dqn.create_dqn(args, env)
+
+
+def iterations(dqn):
+    from keras import backend as K
+
+    return int(K.get_value(checkpoint.optimizer_of(dqn).iterations))
+
+
+def trained_snapshot(env, nb_steps=50):
+    dqn = make_dqn(env)
+    dqn.fit(env, nb_steps=nb_steps, visualize=False, verbose=0)
+    return dqn, checkpoint.snapshot(dqn)
+
+
+def test_adam_iterations_survive_round_trip(tmp_path):
+    env = myenv.make('myenv-v0')
+    dqn, arrays = trained_snapshot(env)
+    assert iterations(dqn) > 0
+    path = str(tmp_path / 'checkpoint.npz')
+    checkpoint.save(arrays, path)
+
+    restored = make_dqn(env)
+    checkpoint.restore(restored, path)
+    assert iterations(restored) == iterations(dqn)
+    for saved, loaded in zip(
+            checkpoint.optimizer_of(dqn).get_weights(),
+            checkpoint.optimizer_of(restored).get_weights()):
+        np.testing.assert_array_equal(saved, loaded)
+
+
+def test_restore_refuses_trained_checkpoint_without_optimizer(tmp_path):
+    env = myenv.make('myenv-v0')
+    _, arrays = trained_snapshot(env)
+    arrays = {name: array for name, array in arrays.items()
+              if not name.startswith('optimizer_')}
+    path = str(tmp_path / 'checkpoint.npz')
+    checkpoint.save(arrays, path)
+
+    with pytest.raises(ValueError):
+        checkpoint.restore(make_dqn(env), path)
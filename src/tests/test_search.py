@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""envAdのalpha-beta相手が、前に打ったgameによらず同じ手を打つか
+
+    cd src && python -m pytest -q tests
+"""
+
+import numpy as np
+
+import myenv
+
+
+def play(env, seed):
+    """空いているマスにseedで決まる順で打ち、観測の列を返す"""
+    random = np.random.RandomState(seed)
+    observation = env.reset()
+    observations = [observation]
+    done = False
+    while not done:
+        empty = np.flatnonzero(observation.ravel() == 2)
+        cell = random.choice(empty)
+        # actionのマスは action - 5 (envAd.MyEnv._stepのaction_coordinate)
+        observation, _, done, _ = env.step((cell + 5) % 25)
+        observations.append(observation)
+    return observations
+
+
+def test_same_seed_same_game_on_one_env():
+    def make():
+        return myenv.make('myenv-v2', opponent='alphabeta', opponent_depth=2)
+
+    env = make()
+    for seed in range(10):
+        # 他のgameを打った後のenvと、新しいenvで同じgameになる
+        played = play(env, seed)
+        again = play(env, seed)
+        fresh = play(make(), seed)
+        assert len(played) == len(again) == len(fresh)
+        for a, b, c in zip(played, again, fresh):
+            np.testing.assert_array_equal(a, b)
+            np.testing.assert_array_equal(a, c)